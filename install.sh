@@ -151,7 +151,7 @@ do_fresh() {
   if [ -f "$INSTALL_DIR/.env" ]; then
     cp "$INSTALL_DIR/.env" "$INSTALL_DIR/.env.bak"
   fi
-  rm -rf "$INSTALL_DIR/venv" "$INSTALL_DIR/.env" "$INSTALL_DIR/jobs.json" 2>/dev/null || true
+  rm -rf "$INSTALL_DIR/venv" "$INSTALL_DIR/.env" "$INSTALL_DIR/jobs.json" "$INSTALL_DIR/last_runs.json" 2>/dev/null || true
   if ! (cd "$INSTALL_DIR" 2>/dev/null && in_repo); then
     rm -rf "$INSTALL_DIR/src" "$INSTALL_DIR/requirements.txt" "$INSTALL_DIR/install.sh" "$INSTALL_DIR/.env.example" "$INSTALL_DIR/.gitignore" "$INSTALL_DIR/README.md" 2>/dev/null || true
   fi
@@ -1,15 +1,28 @@
-"""Telegram bot: inline-only keyboards, delete-then-send on button click, job CRUD, config."""
+"""Telegram bot: inline-only keyboards, edit-in-place on button click, job CRUD, config."""
+import functools
+import hashlib
+import os
 import re
 import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from html import escape
 from typing import Callable
 
+import requests
 import telebot
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from telebot import apihelper
+from telebot.apihelper import ApiTelegramException
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from src import config as config_module
 from src.config import (
     ADMIN_USER_ID,
+    ADMIN_USER_ID_INT,
     BOT_TOKEN,
     get_env_path,
     mask_token,
@@ -18,17 +31,56 @@ from src.error_reporting import send_error
 from src.jobs_store import (
     add_job,
     delete_job,
-    get_job_by_name,
     load_jobs,
+    refresh as refresh_jobs,
     save_jobs,
     update_job,
 )
+from src.last_runs_store import get_last_runs, last_runs_version
 
 # Max callback_data length
 CB_MAX = 64
-# In-memory state for multi-step flows (chat_id -> dict)
-_state: dict[int, dict] = {}
-_state_lock = threading.Lock()
+# Short callback key -> job name (callback_data carries the key, not the name)
+_cb_index: dict[str, str] = {}
+# Allowed job names, 1-32 chars (the bound also stops the scan early on long input)
+_NAME_RE = re.compile(r"^[a-zA-Z0-9_. -]{1,32}\Z")
+# Message deletions queued per chat, flushed in one deleteMessages call
+_pending_deletes: dict[int, list[int]] = defaultdict(list)
+_pending_deletes_lock = threading.Lock()
+_delete_timer: threading.Timer | None = None
+_DELETE_FLUSH_SEC = 0.2
+_DELETE_BATCH_MAX = 50
+# Parsed jobs for menu renders: (jobs_version, jobs, {name: job})
+_jobs_cache: tuple[int, list[dict], dict[str, dict]] | None = None
+_jobs_cache_lock = threading.Lock()
+# Jobs list keyboard: (jobs_version, markup)
+_jobs_markup_cache: tuple[int, InlineKeyboardMarkup] | None = None
+# Jobs list text: ((jobs_version, next-run labels), text)
+_jobs_view_cache: tuple[tuple, str] | None = None
+# .env lines kept in memory between config updates (comments preserved)
+_env_lines: list[str] | None = None
+# (st_mtime_ns, st_size) of .env when _env_lines was read/written; a change means a manual edit
+_env_stat: tuple[int, int] | None = None
+_env_lock = threading.Lock()
+# Pending debounced scheduler reload
+_reload_timer: threading.Timer | None = None
+_reload_lock = threading.Lock()
+_RELOAD_DEBOUNCE_SEC = 0.5
+_scheduler_reloader: Callable[[], None] | None = None
+# Non-admin users already told "access denied" (LRU, oldest dropped first)
+_recent_unauth: OrderedDict[int, None] = OrderedDict()
+_recent_unauth_lock = threading.Lock()
+_RECENT_UNAUTH_MAX = 1024
+# Outbound sends from update handlers (handlers return without waiting on Telegram)
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tg-io")
+# Callback-query acks are fire-and-forget so handlers never wait on them
+_ack_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tg-ack")
+# "Run now" pings; bounded so repeated clicks queue instead of spawning threads
+_run_now_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job-run-now")
+# Update handler threads: handlers are I/O-bound on Telegram calls, so overlap them
+_BOT_WORKER_THREADS = 8
+# Keep-alive connections to api.telegram.org shared by all threads (handlers, acks, scheduler)
+_API_POOL_MAXSIZE = 16
 
 _FIELD_LABELS = {
     "target": "Target",
@@ -40,12 +92,36 @@ _CONFIG_LABELS = {
     "PING_DEFAULT_INTERVAL": "Default Interval",
     "PING_DEFAULT_COUNT": "Default Count",
 }
+# Numeric job fields: (parser, range check, reply when invalid)
+_FIELD_SPECS: dict[str, tuple[Callable, Callable, str]] = {
+    "interval_sec": (
+        float,
+        lambda v: 0 < v <= 3600,
+        "⚠️ <b>Invalid interval.</b> Send a positive number (e.g. 0.01 or 0.2).",
+    ),
+    "count": (
+        int,
+        lambda v: 1 <= v <= 100000,
+        "⚠️ <b>Invalid count.</b> Send an integer from 1 to 100000.",
+    ),
+    "schedule_minutes": (
+        int,
+        lambda v: 1 <= v <= 10080,  # max 1 week
+        "⚠️ <b>Invalid schedule.</b> Send minutes between 1 and 10080.",
+    ),
+}
 
 
 def _h(value: object) -> str:
     return escape(str(value), quote=False)
 
 
+@functools.lru_cache(maxsize=256)
+def _name_h(name: str) -> str:
+    """Escaped job name; names are few and reused across every menu, so escape each once."""
+    return _h(name)
+
+
 def _send_html(
     bot: telebot.TeleBot,
     chat_id: int,
@@ -55,10 +131,66 @@ def _send_html(
     bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode="HTML")
 
 
+def _send_html_async(
+    bot: telebot.TeleBot,
+    chat_id: int,
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    context: str = "bot: send_message",
+) -> Future:
+    """Send on the I/O pool so the update handler returns without waiting for Telegram."""
+    future = _io_pool.submit(_send_html, bot, chat_id, text, reply_markup)
+
+    def _report(f: Future) -> None:
+        exc = f.exception()
+        if exc is not None:
+            send_error(exc, context)
+
+    future.add_done_callback(_report)
+    return future
+
+
+def _submit_run_now(
+    run_job_now_callback: Callable[[str], None],
+    job_name: str,
+    after: Future | None = None,
+) -> None:
+    """
+    Run a job once on the shared pool; failures go to send_error. With after (the send of
+    the "Running…" message), the run starts only once that send finished, so the report
+    can never reach the chat before the message announcing it.
+    """
+    if after is not None:
+        after.add_done_callback(lambda _f: _submit_run_now(run_job_now_callback, job_name))
+        return
+    future = _run_now_pool.submit(run_job_now_callback, job_name)
+
+    def _report(f: Future) -> None:
+        exc = f.exception()
+        if exc is not None:
+            send_error(exc, "bot: run_now")
+
+    future.add_done_callback(_report)
+
+
 def _reply_html(bot: telebot.TeleBot, msg, text: str) -> None:
     bot.reply_to(msg, text, parse_mode="HTML")
 
 
+def _parse_field_or_reply(bot: telebot.TeleBot, msg, field: str, text: str) -> float | int | None:
+    """Parse a numeric job field per _FIELD_SPECS; reply and return None if invalid."""
+    parser, in_range, error_text = _FIELD_SPECS[field]
+    try:
+        val = parser(text)
+        if not in_range(val):
+            raise ValueError("out of range")
+    except ValueError as e:
+        send_error(e, f"bot: parse {field}")
+        _reply_html(bot, msg, error_text)
+        return None
+    return val
+
+
 def _field_label(field: str) -> str:
     return _FIELD_LABELS.get(field, field)
 
@@ -69,24 +201,108 @@ def _config_label(key: str) -> str:
 
 def _fmt_num(value: object) -> str:
     if isinstance(value, float):
-        return f"{value:.3f}".rstrip("0").rstrip(".")
+        # 'g' drops trailing zeros in one pass: 0.2 -> "0.2", 1.0 -> "1".
+        return str(int(value)) if value.is_integer() else format(value, "g")
     return str(value)
 
 
 def _is_admin(user_id: int) -> bool:
-    return str(user_id) == ADMIN_USER_ID
+    return user_id == ADMIN_USER_ID_INT
+
+
+def _first_unauth(user_id: int) -> bool:
+    """True the first time a non-admin shows up; repeat attempts are ignored silently."""
+    with _recent_unauth_lock:
+        if user_id in _recent_unauth:
+            _recent_unauth.move_to_end(user_id)
+            return False
+        _recent_unauth[user_id] = None
+        if len(_recent_unauth) > _RECENT_UNAUTH_MAX:
+            _recent_unauth.popitem(last=False)
+        return True
+
+
+def _flush_deletes(bot: telebot.TeleBot) -> None:
+    """Delete all queued messages with one deleteMessages call per chat."""
+    global _delete_timer
+    with _pending_deletes_lock:
+        pending = dict(_pending_deletes)
+        _pending_deletes.clear()
+        _delete_timer = None
+    for chat_id, ids in pending.items():
+        for i in range(0, len(ids), _DELETE_BATCH_MAX):
+            try:
+                bot.delete_messages(chat_id, ids[i : i + _DELETE_BATCH_MAX])
+            except ApiTelegramException as e:
+                if e.error_code == 403 or "MESSAGE_DELETE_FORBIDDEN" in str(e):
+                    continue
+                send_error(e, "bot: delete_messages")
+            except Exception as e:
+                send_error(e, "bot: delete_messages")
+
+
+def _queue_delete(bot: telebot.TeleBot, chat_id: int, message_id: int) -> None:
+    """Queue a message for deletion; flushed after a short window or when the batch is full."""
+    global _delete_timer
+    with _pending_deletes_lock:
+        _pending_deletes[chat_id].append(message_id)
+        full = len(_pending_deletes[chat_id]) >= _DELETE_BATCH_MAX
+        if not full and _delete_timer is None:
+            _delete_timer = threading.Timer(_DELETE_FLUSH_SEC, _flush_deletes, args=[bot])
+            _delete_timer.daemon = True
+            _delete_timer.start()
+    if full:
+        _flush_deletes(bot)
 
 
-def _delete_and_send(bot: telebot.TeleBot, chat_id: int, message_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
-    """Delete the message and send a new one (clean chat)."""
+def flush_pending_deletes(bot: telebot.TeleBot) -> None:
+    """Send any queued deletions now (call on shutdown so the last window isn't lost)."""
+    with _pending_deletes_lock:
+        if _delete_timer is not None:
+            _delete_timer.cancel()
+    _flush_deletes(bot)
+
+
+def shutdown_pools() -> None:
+    """
+    Stop the send/ack and "Run now" pools without waiting; queued work is dropped and a
+    manual run still in flight is abandoned (call on shutdown).
+    """
+    for pool in (_io_pool, _ack_pool, _run_now_pool):
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _delete_and_send(bot: telebot.TeleBot, chat_id: int, message_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> Future:
+    """Queue the message for deletion and send a new one (clean chat) on the I/O pool."""
+    _queue_delete(bot, chat_id, message_id)
+    return _send_html_async(bot, chat_id, text, reply_markup, "bot: send_message in _delete_and_send")
+
+
+def _ack(bot: telebot.TeleBot, callback_id: str, text: str | None = None) -> None:
+    """Answer a callback query in the background (stops the client's spinner)."""
+
+    def _answer() -> None:
+        try:
+            bot.answer_callback_query(callback_id, text)
+        except Exception as e:
+            send_error(e, "bot: answer_callback_query")
+
+    _ack_pool.submit(_answer)
+
+
+def _edit_or_send(bot: telebot.TeleBot, chat_id: int, message_id: int, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+    """Edit the message in place (one API call); send a new one if it can't be edited."""
     try:
-        bot.delete_message(chat_id, message_id)
+        bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup, parse_mode="HTML")
+        return
     except Exception as e:
-        send_error(e, "bot: delete_message")
+        if isinstance(e, ApiTelegramException) and "message is not modified" in str(e):
+            return
+        send_error(e, "bot: edit_message_text")
     try:
         _send_html(bot, chat_id, text, reply_markup=reply_markup)
     except Exception as e:
-        send_error(e, "bot: send_message in _delete_and_send")
+        send_error(e, "bot: send_message in _edit_or_send")
         raise
 
 
@@ -100,17 +316,23 @@ def _main_menu_markup() -> InlineKeyboardMarkup:
     return m
 
 
+@functools.lru_cache(maxsize=512)
+def _fmt_iso_display(iso: str) -> str:
+    """Format a stored ISO timestamp for display; cached since last_run_at strings repeat across renders."""
+    try:
+        dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    except (ValueError, TypeError) as e:
+        send_error(e, "bot: _format_run_time fromisoformat")
+        return "—"
+    return _format_run_time(dt)
+
+
 def _format_run_time(dt_or_iso: datetime | str | None) -> str:
     """Format datetime or ISO string for display; return '—' if missing."""
     if dt_or_iso is None:
         return "—"
     if isinstance(dt_or_iso, str):
-        try:
-            s = dt_or_iso.replace("Z", "+00:00")
-            dt_or_iso = datetime.fromisoformat(s)
-        except (ValueError, TypeError) as e:
-            send_error(e, "bot: _format_run_time fromisoformat")
-            return "—"
+        return _fmt_iso_display(dt_or_iso)
     try:
         return dt_or_iso.strftime("%d %b %H:%M")
     except (ValueError, TypeError) as e:
@@ -118,34 +340,71 @@ def _format_run_time(dt_or_iso: datetime | str | None) -> str:
         return "—"
 
 
-def _jobs_list_markup(next_run_times: dict | None = None) -> tuple[str, InlineKeyboardMarkup]:
-    jobs = load_jobs()
-    next_run_times = next_run_times or {}
-    if not jobs:
-        text = "<b>🗂️ Ping Jobs</b>\nNo jobs yet. Tap ➕ Add Job to create one."
-    else:
-        lines = [f"<b>🗂️ Ping Jobs</b>", f"Total: <b>{len(jobs)}</b>", ""]
-        for j in jobs:
-            name = j.get("name", "?")
-            target = j.get("target", "?")
-            interval = _fmt_num(j.get("interval_sec", "?"))
-            count = j.get("count", "?")
-            sched = j.get("schedule_minutes", "?")
-            last_run = _format_run_time(j.get("last_run_at"))
-            next_run = _format_run_time(next_run_times.get(name))
-            lines.append(f"• <b>{_h(name)}</b>")
-            lines.append(f"🎯 <b>Target:</b> {_h(target)}")
-            lines.append(f"📦 <b>Test:</b> {count} packets (interval {interval}s)")
-            lines.append(f"🗓️ <b>Schedule:</b> every {sched} min")
-            lines.append(f"🕘 <b>Last:</b> {last_run} • <b>Next:</b> {next_run}")
-            lines.append("")
-        text = "\n".join(lines).rstrip()
+def _load_jobs_cached() -> tuple[int, list[dict], dict[str, dict]]:
+    """Return (version, jobs, {name: job}), rebuilt only after jobs changed (in the bot or on disk)."""
+    global _jobs_cache
+    with _jobs_cache_lock:
+        version = refresh_jobs()
+        if _jobs_cache is None or _jobs_cache[0] != version:
+            jobs = load_jobs()
+            by_name: dict[str, dict] = {}
+            for j in jobs:
+                by_name.setdefault(j.get("name"), j)
+            _jobs_cache = (version, jobs, by_name)
+        return _jobs_cache
+
+
+def _get_jobs_cached() -> list[dict]:
+    return _load_jobs_cached()[1]
+
+
+def _lookup_job(name: str) -> dict | None:
+    """O(1) replacement for get_job_by_name on the bot's paths."""
+    return _load_jobs_cached()[2].get(name)
+
+
+def _cb_key(name: str) -> str:
+    """Stable 8-hex-char key for a job name."""
+    return hashlib.blake2b(name.encode("utf-8"), digest_size=4).hexdigest()
+
+
+def _cb(prefix: str, name: str) -> str:
+    """Build callback_data for a job button; always far below CB_MAX whatever the name length."""
+    key = _cb_key(name)
+    _cb_index[key] = name
+    return f"{prefix}:{key}"
+
+
+def _cb_name(key: str) -> str | None:
+    """
+    Resolve a callback key back to its job name (keys survive restarts via a rebuild from
+    disk); None when no job has that key, e.g. a button left over from a deleted job.
+    """
+    name = _cb_index.get(key)
+    if name is None:
+        _rebuild_cb_index(_get_jobs_cached())
+        name = _cb_index.get(key)
+    return name
+
+
+def _rebuild_cb_index(jobs: list[dict]) -> None:
+    global _cb_index
+    _cb_index = {_cb_key(str(j.get("name", "?"))): str(j.get("name", "?")) for j in jobs}
+
+
+def _jobs_keyboard(version: int, jobs: list[dict]) -> InlineKeyboardMarkup:
+    """Jobs list keyboard, rebuilt only when the jobs themselves changed."""
+    global _jobs_markup_cache
+    cached = _jobs_markup_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    _rebuild_cb_index(jobs)
     m = InlineKeyboardMarkup()
     for j in jobs:
         name = j.get("name", "?")
-        cb_edit = f"job_edit:{name}"[:CB_MAX]
-        cb_del = f"job_del:{name}"[:CB_MAX]
-        cb_run = f"job_run:{name}"[:CB_MAX]
+        cb_edit = _cb("job_edit", name)
+        cb_del = _cb("job_del", name)
+        cb_run = _cb("job_run", name)
         m.row(
             InlineKeyboardButton("▶️ Run", callback_data=cb_run),
             InlineKeyboardButton("✏️ Edit", callback_data=cb_edit),
@@ -153,34 +412,71 @@ def _jobs_list_markup(next_run_times: dict | None = None) -> tuple[str, InlineKe
         )
     m.row(InlineKeyboardButton("➕ Add Job", callback_data="job_add"))
     m.row(InlineKeyboardButton("⬅️ Back", callback_data="menu_main"))
-    return text, m
+    _jobs_markup_cache = (version, m)
+    return m
 
 
+def _jobs_list_markup(next_run_times: dict | None = None) -> tuple[str, InlineKeyboardMarkup]:
+    global _jobs_view_cache
+    version, jobs, _ = _load_jobs_cached()
+    next_run_times = next_run_times or {}
+    # Next-run labels have minute resolution, so the text only changes when they (or the jobs) do
+    next_labels = tuple(_format_run_time(next_run_times.get(j.get("name", "?"))) for j in jobs)
+    key = (version, last_runs_version(), next_labels)
+    cached = _jobs_view_cache
+    if cached is not None and cached[0] == key:
+        return cached[1], _jobs_keyboard(version, jobs)
+    if not jobs:
+        text = "<b>🗂️ Ping Jobs</b>\nNo jobs yet. Tap ➕ Add Job to create one."
+    else:
+        runs = get_last_runs()
+        # One f-string per job; only name/target are user text and need escaping
+        blocks = [
+            f"• <b>{_name_h(str(j.get('name', '?')))}</b>\n"
+            f"🎯 <b>Target:</b> {_h(j.get('target', '?'))}\n"
+            f"📦 <b>Test:</b> {j.get('count', '?')} packets (interval {_fmt_num(j.get('interval_sec', '?'))}s)\n"
+            f"🗓️ <b>Schedule:</b> every {j.get('schedule_minutes', '?')} min\n"
+            f"🕘 <b>Last:</b> {_format_run_time(runs.get(j.get('name')) or j.get('last_run_at'))} • <b>Next:</b> {next_run}"
+            for j, next_run in zip(jobs, next_labels)
+        ]
+        text = f"<b>🗂️ Ping Jobs</b>\nTotal: <b>{len(jobs)}</b>\n\n" + "\n\n".join(blocks)
+    _jobs_view_cache = (key, text)
+    return text, _jobs_keyboard(version, jobs)
+
+
+@functools.lru_cache(maxsize=128)
 def _job_edit_field_markup(job_name: str) -> InlineKeyboardMarkup:
     m = InlineKeyboardMarkup()
     for label, field in [("🎯 Target", "target"), ("⏱️ Interval (s)", "interval_sec"), ("📦 Packet Count", "count"), ("🗓️ Schedule (min)", "schedule_minutes")]:
-        cb = f"editfield:{job_name}:{field}"[:CB_MAX]
+        cb = f"{_cb('editfield', job_name)}:{field}"
         m.row(InlineKeyboardButton(label, callback_data=cb))
     m.row(InlineKeyboardButton("⬅️ Back to Jobs", callback_data="menu_jobs"))
     return m
 
 
+@functools.lru_cache(maxsize=128)
+def _delete_confirm_markup(job_name: str) -> InlineKeyboardMarkup:
+    m = InlineKeyboardMarkup()
+    m.row(InlineKeyboardButton("🗑️ Yes, delete", callback_data=_cb("del_yes", job_name)))
+    m.row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_jobs"))
+    return m
+
+
+# Token, admin id and .env path never change at runtime; only the defaults do.
+_CFG_STATIC = "\n".join([
+    "<b>⚙️ Settings</b>",
+    f"• <b>BOT_TOKEN:</b> <code>{_h(mask_token(BOT_TOKEN) if BOT_TOKEN else '****')}</code>",
+    f"• <b>ADMIN_USER_ID:</b> <code>{_h(ADMIN_USER_ID)}</code>",
+    f"• <b>.env Path:</b> <code>{_h(get_env_path())}</code>",
+])
+
+
 def _config_text() -> str:
-    env_path = get_env_path()
-    token_masked = mask_token(BOT_TOKEN) if BOT_TOKEN else "****"
-    lines = [
-        "<b>⚙️ Settings</b>",
-        f"• <b>BOT_TOKEN:</b> <code>{_h(token_masked)}</code>",
-        f"• <b>ADMIN_USER_ID:</b> <code>{_h(ADMIN_USER_ID)}</code>",
-        f"• <b>.env Path:</b> <code>{_h(env_path)}</code>",
-    ]
-    try:
-        from src import config as config_module
-        lines.append(f"• <b>Default Interval:</b> {_fmt_num(config_module.PING_DEFAULT_INTERVAL)} s")
-        lines.append(f"• <b>Default Count:</b> {config_module.PING_DEFAULT_COUNT}")
-    except Exception as e:
-        send_error(e, "bot: _config_text config_module")
-    return "\n".join(lines)
+    return (
+        f"{_CFG_STATIC}\n"
+        f"• <b>Default Interval:</b> {_fmt_num(config_module.PING_DEFAULT_INTERVAL)} s\n"
+        f"• <b>Default Count:</b> {config_module.PING_DEFAULT_COUNT}"
+    )
 
 
 def _config_markup() -> InlineKeyboardMarkup:
@@ -196,71 +492,180 @@ def _help_text() -> str:
         "<b>❓ Help</b>\n"
         "• <b>Jobs:</b> Create, edit, and delete ping jobs. Each job runs every N minutes and sends a report here.\n"
         "• <b>Settings:</b> View your .env (token masked) and set defaults for new jobs.\n"
-        "• <b>Ping command:</b> <code>ping -c &lt;count&gt; -i &lt;interval_sec&gt; &lt;target&gt;</code>\n"
-        "On Linux, intervals below 0.2s may require root."
+        "• <b>Pings:</b> Sent directly over an unprivileged ICMP socket when the system allows it "
+        "(any interval, no root). Otherwise <code>ping -c &lt;count&gt; -i &lt;interval_sec&gt; &lt;target&gt;</code> "
+        "is used, where intervals below 0.2s may require root."
     )
 
 
-def _set_state(chat_id: int, data: dict) -> None:
-    with _state_lock:
-        _state[chat_id] = data
+# Static menus: built once, reused on every render
+_MAIN_MENU_MARKUP = _main_menu_markup()
+_CONFIG_MARKUP = _config_markup()
+_HELP_TEXT = _help_text()
+_HELP_MARKUP = InlineKeyboardMarkup().row(InlineKeyboardButton("⬅️ Back", callback_data="menu_main"))
+_CANCEL_TO_JOBS_MARKUP = InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_jobs"))
+_CANCEL_TO_CFG_MARKUP = InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_cfg"))
+
+
+@dataclass(slots=True)
+class _ChatState:
+    """Multi-step flow state for one chat; only the fields of the current flow are used."""
+    flow: str
+    step: str = ""
+    name: str = ""
+    target: str = ""
+    interval_sec: float = 0.0
+    count: int = 0
+    job_name: str = ""
+    field: str = ""
+    key: str = ""
+    menu_msg_id: int = 0
+
+
+class _StateMap:
+    """Per-chat flow state (chat_id -> _ChatState) with one lock per chat, so chats never contend."""
+
+    def __init__(self) -> None:
+        self._data: dict[int, _ChatState] = {}
+        # Never removed: a lock may be held or awaited while its flow is cleared. Only the
+        # admin's chat gets this far, so the map stays tiny.
+        self._locks: dict[int, threading.Lock] = {}
 
+    def lock(self, chat_id: int) -> threading.Lock:
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            # setdefault is atomic, so racing first callers still end up with the same lock
+            lock = self._locks.setdefault(chat_id, threading.Lock())
+        return lock
 
-def _get_state(chat_id: int) -> dict | None:
-    with _state_lock:
-        return _state.get(chat_id)
+    def get(self, chat_id: int) -> _ChatState | None:
+        with self.lock(chat_id):
+            return self._data.get(chat_id)
+
+    def set(self, chat_id: int, data: _ChatState) -> None:
+        with self.lock(chat_id):
+            self._data[chat_id] = data
+
+    def update(self, chat_id: int, updates: dict) -> None:
+        with self.lock(chat_id):
+            state = self._data.get(chat_id)
+            if state is not None:
+                for name, value in updates.items():
+                    setattr(state, name, value)
+
+    def clear(self, chat_id: int) -> None:
+        with self.lock(chat_id):
+            self._data.pop(chat_id, None)
+
+
+# In-memory state for multi-step flows
+_state = _StateMap()
+
+
+def _set_state(chat_id: int, data: _ChatState) -> None:
+    _state.set(chat_id, data)
+
+
+def _get_state(chat_id: int) -> _ChatState | None:
+    return _state.get(chat_id)
+
+
+def _mutate_state(chat_id: int, **updates) -> None:
+    """Update the chat's state in place (no copy per step)."""
+    _state.update(chat_id, updates)
 
 
 def _clear_state(chat_id: int) -> None:
-    with _state_lock:
-        _state.pop(chat_id, None)
+    _state.clear(chat_id)
 
 
-def _update_env_key(key: str, value: str) -> None:
-    path = get_env_path()
-    if not path.exists():
-        path.write_text(f"{key}={value}\n", encoding="utf-8")
-        from dotenv import load_dotenv
-        load_dotenv(path)
-        import src.config as config_module
+def set_scheduler_reloader(reloader: Callable[[], None] | None) -> None:
+    """Called by main at startup with the callable that reloads scheduler jobs."""
+    global _scheduler_reloader
+    _scheduler_reloader = reloader
+
+
+def _do_reload() -> None:
+    global _reload_timer
+    with _reload_lock:
+        _reload_timer = None
+    try:
+        if _scheduler_reloader:
+            _scheduler_reloader()
+    except Exception as e:
+        send_error(e, "bot: _do_reload")
+
+
+def _schedule_reload() -> None:
+    """Reload the scheduler once, shortly after the last of a burst of job changes."""
+    global _reload_timer
+    with _reload_lock:
+        if _reload_timer is not None:
+            _reload_timer.cancel()
+        _reload_timer = threading.Timer(_RELOAD_DEBOUNCE_SEC, _do_reload)
+        _reload_timer.daemon = True
+        _reload_timer.start()
+
+
+def _apply_config_key(key: str, value: str) -> None:
+    """Update the in-memory config value (and os.environ) for key; no .env re-parse."""
+    os.environ[key] = value
+    try:
         if key == "PING_DEFAULT_INTERVAL":
-            try:
-                config_module.PING_DEFAULT_INTERVAL = float(value)
-            except ValueError as e:
-                send_error(e, "bot: _update_env_key PING_DEFAULT_INTERVAL (new file)")
-        elif key == "PING_DEFAULT_COUNT":
-            try:
-                config_module.PING_DEFAULT_COUNT = int(value)
-            except ValueError as e:
-                send_error(e, "bot: _update_env_key PING_DEFAULT_COUNT (new file)")
-        return
-    content = path.read_text(encoding="utf-8")
-    lines = content.splitlines()
-    new_lines = []
-    found = False
-    for line in lines:
-        if line.strip().startswith(f"{key}="):
-            new_lines.append(f"{key}={value}")
-            found = True
-        else:
-            new_lines.append(line)
-    if not found:
-        new_lines.append(f"{key}={value}")
-    path.write_text("\n".join(new_lines) + "\n", encoding="utf-8")
-    # Reload in-memory config
-    from dotenv import load_dotenv
-    load_dotenv(path)
-    import src.config as config_module
-    if key == "PING_DEFAULT_INTERVAL":
-        try:
             config_module.PING_DEFAULT_INTERVAL = float(value)
-        except ValueError as e:
-            send_error(e, "bot: _update_env_key PING_DEFAULT_INTERVAL")
-    elif key == "PING_DEFAULT_COUNT":
-        try:
+        elif key == "PING_DEFAULT_COUNT":
             config_module.PING_DEFAULT_COUNT = int(value)
-        except ValueError as e:
-            send_error(e, "bot: _update_env_key PING_DEFAULT_COUNT")
+    except ValueError as e:
+        send_error(e, f"bot: _apply_config_key {key}")
+
+
+def _update_env_key(key: str, value: str) -> None:
+    """
+    Set key in .env; cached lines are patched in memory and the file is only rewritten if it
+    changed. The cache is re-read whenever .env's mtime or size differs (manual edits survive).
+    """
+    global _env_lines, _env_stat
+    path = get_env_path()
+    new_line = f"{key}={value}"
+    with _env_lock:
+        try:
+            st = path.stat()
+            current = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            current = None
+        if _env_lines is None or current != _env_stat:
+            _env_lines = path.read_text(encoding="utf-8").splitlines() if current is not None else []
+            _env_stat = current
+        prefix = f"{key}="
+        for i, line in enumerate(_env_lines):
+            if line.strip().startswith(prefix):
+                changed = line != new_line
+                _env_lines[i] = new_line
+                break
+        else:
+            changed = True
+            _env_lines.append(new_line)
+        if changed:
+            # Write a sibling temp file and swap it in, so .env is never left half-written
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text("\n".join(_env_lines) + "\n", encoding="utf-8")
+            os.replace(tmp, path)
+            st = path.stat()
+            _env_stat = (st.st_mtime_ns, st.st_size)
+    _apply_config_key(key, value)
+
+
+def _api_session() -> requests.Session:
+    """One pooled session for every Telegram API call, so TLS connections are reused across threads."""
+    session = requests.Session()
+    # Retries cover connection failures; urllib3 won't replay POSTs on read errors, so no duplicate sends
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=_API_POOL_MAXSIZE,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
+    return session
 
 
 def create_bot(
@@ -274,7 +679,8 @@ def create_bot(
     run_job_now_callback(name) runs a job once (called from "Run now").
     get_next_run_times_callback() returns {job_name: next_run_time} for the jobs list.
     """
-    bot = telebot.TeleBot(BOT_TOKEN)
+    apihelper.session = _api_session()
+    bot = telebot.TeleBot(BOT_TOKEN, threaded=True, num_threads=_BOT_WORKER_THREADS)
 
     def _get_next_times() -> dict:
         return get_next_run_times_callback() if get_next_run_times_callback else {}
@@ -282,191 +688,207 @@ def create_bot(
     def _jobs_list_with_times():
         return _jobs_list_markup(_get_next_times())
 
+    def _on_stale_job(chat_id: int, msg_id: int) -> None:
+        """A button for a job that no longer exists: say so and show the current list."""
+        text, mk = _jobs_list_with_times()
+        _edit_or_send(bot, chat_id, msg_id, f"❌ <b>Job not found.</b>\n\n{text}", mk)
+
     def send_to_admin(text: str) -> None:
         if send_message_callback:
-            send_message_callback(int(ADMIN_USER_ID), text)
+            send_message_callback(ADMIN_USER_ID_INT, text)
         else:
-            _send_html(bot, int(ADMIN_USER_ID), text)
+            _send_html(bot, ADMIN_USER_ID_INT, text)
 
     @bot.message_handler(commands=["start", "help"])
     def cmd_start_help(msg):
-        if not _is_admin(msg.from_user.id):
-            _reply_html(bot, msg, "🚫 <b>Access denied.</b> This bot is private.")
+        user_id = msg.from_user.id
+        if not _is_admin(user_id):
+            if _first_unauth(user_id):
+                _reply_html(bot, msg, "🚫 <b>Access denied.</b> This bot is private.")
             return
         text = "<b>📡 Ping Status</b>\nChoose an option below:"
-        _send_html(bot, msg.chat.id, text, reply_markup=_main_menu_markup())
+        _send_html_async(bot, msg.chat.id, text, reply_markup=_MAIN_MENU_MARKUP)
 
-    @bot.callback_query_handler(func=lambda c: True)
-    def on_callback(c):
-        if not _is_admin(c.from_user.id):
-            try:
-                bot.answer_callback_query(c.id, "Access denied.")
-            except Exception as e:
-                send_error(e, "bot: answer_callback_query Unauthorized")
-            return
-        chat_id = c.message.chat.id
-        msg_id = c.message.message_id
-        data = c.data or ""
+    def _on_menu_main(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _edit_or_send(bot, chat_id, msg_id, "Choose an option below:", _MAIN_MENU_MARKUP)
 
-        # Main menu
-        if data == "menu_main":
-            _delete_and_send(bot, chat_id, msg_id, "Choose an option below:", _main_menu_markup())
-            return
-        if data == "menu_jobs":
-            text, mk = _jobs_list_with_times()
-            _delete_and_send(bot, chat_id, msg_id, text, mk)
-            return
-        if data == "menu_cfg":
-            _delete_and_send(bot, chat_id, msg_id, _config_text(), _config_markup())
+    def _on_menu_jobs(c, chat_id: int, msg_id: int, arg: str) -> None:
+        text, mk = _jobs_list_with_times()
+        _edit_or_send(bot, chat_id, msg_id, text, mk)
+
+    def _on_menu_cfg(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _edit_or_send(bot, chat_id, msg_id, _config_text(), _CONFIG_MARKUP)
+
+    def _on_menu_help(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _edit_or_send(bot, chat_id, msg_id, _HELP_TEXT, _HELP_MARKUP)
+
+    def _on_job_add(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _set_state(chat_id, _ChatState(flow="addjob", step="name"))
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            "✍️ <b>Job name</b>\nSend a short name (e.g. <code>cloudflare</code>):",
+            _CANCEL_TO_JOBS_MARKUP,
+        )
+
+    def _on_job_edit(c, chat_id: int, msg_id: int, arg: str) -> None:
+        """Edit job: pick field."""
+        job_name = _cb_name(arg)
+        if job_name is None:
+            _on_stale_job(chat_id, msg_id)
             return
-        if data == "menu_help":
-            _delete_and_send(bot, chat_id, msg_id, _help_text(), InlineKeyboardMarkup().row(InlineKeyboardButton("⬅️ Back", callback_data="menu_main")))
+        job = _lookup_job(job_name)
+        if not job:
+            _edit_or_send(bot, chat_id, msg_id, f"❌ <b>Job not found:</b> <code>{_name_h(job_name)}</code>", _MAIN_MENU_MARKUP)
             return
+        _set_state(chat_id, _ChatState(flow="edit", job_name=job_name))
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            f"✏️ <b>Edit Job:</b> <code>{_name_h(job_name)}</code>\nChoose what to change:",
+            _job_edit_field_markup(job_name),
+        )
 
-        # Add job flow
-        if data == "job_add":
-            _set_state(chat_id, {"flow": "addjob", "step": "name"})
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                "✍️ <b>Job name</b>\nSend a short name (e.g. <code>cloudflare</code>):",
-                InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_jobs")),
-            )
+    def _on_editfield(c, chat_id: int, msg_id: int, arg: str) -> None:
+        key, _, field = arg.partition(":")
+        if not field:
+            text, mk = _jobs_list_with_times()
+            _edit_or_send(bot, chat_id, msg_id, text, mk)
             return
-
-        # Edit job: pick field
-        if data.startswith("job_edit:"):
-            job_name = data[9:].strip()
-            job = get_job_by_name(job_name)
-            if not job:
-                _delete_and_send(bot, chat_id, msg_id, f"❌ <b>Job not found:</b> <code>{_h(job_name)}</code>", _main_menu_markup())
-                return
-            _set_state(chat_id, {"flow": "edit", "job_name": job_name})
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                f"✏️ <b>Edit Job:</b> <code>{_h(job_name)}</code>\nChoose what to change:",
-                _job_edit_field_markup(job_name),
-            )
+        job_name = _cb_name(key)
+        if job_name is None:
+            _on_stale_job(chat_id, msg_id)
             return
+        _set_state(chat_id, _ChatState(flow="edit_field", job_name=job_name, field=field, menu_msg_id=msg_id))
+        field_label = _field_label(field)
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            f"✍️ <b>New value</b>\nSend a new value for <b>{_h(field_label)}</b> (job: <code>{_name_h(job_name)}</code>):",
+            _CANCEL_TO_JOBS_MARKUP,
+        )
 
-        # Edit field
-        if data.startswith("editfield:"):
-            parts = data.split(":", 2)
-            if len(parts) < 3:
-                text, mk = _jobs_list_with_times()
-                _delete_and_send(bot, chat_id, msg_id, text, mk)
-                return
-            job_name, field = parts[1], parts[2]
-            _set_state(chat_id, {"flow": "edit_field", "job_name": job_name, "field": field})
-            field_label = _field_label(field)
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                f"✍️ <b>New value</b>\nSend a new value for <b>{_h(field_label)}</b> (job: <code>{_h(job_name)}</code>):",
-                InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_jobs")),
-            )
+    def _on_job_run(c, chat_id: int, msg_id: int, arg: str) -> None:
+        job_name = _cb_name(arg)
+        if job_name is None:
+            _ack(bot, c.id, "Job not found")
+            _on_stale_job(chat_id, msg_id)
             return
-
-        # Delete job: confirm
-        if data.startswith("job_run:"):
-            job_name = data[8:].strip()
-            try:
-                bot.answer_callback_query(c.id, "Running…")
-            except Exception as e:
-                send_error(e, "bot: answer_callback_query Running job")
-            _send_html(bot, chat_id, f"▶️ <b>Running now:</b> <code>{_h(job_name)}</code>")
-            if run_job_now_callback:
-                def _run():
-                    run_job_now_callback(job_name)
-                t = threading.Thread(target=_run, daemon=True)
-                t.start()
-            return
-        if data.startswith("job_del:"):
-            job_name = data[8:].strip()
-            _set_state(chat_id, {"flow": "del_confirm", "job_name": job_name})
-            m = InlineKeyboardMarkup()
-            m.row(InlineKeyboardButton("🗑️ Yes, delete", callback_data=f"del_yes:{job_name}"[:CB_MAX]))
-            m.row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_jobs"))
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                f"🗑️ <b>Delete job?</b>\nThis will remove <code>{_h(job_name)}</code>.",
-                m,
-            )
+        _ack(bot, c.id, "Running…")
+        sent = _send_html_async(bot, chat_id, f"▶️ <b>Running now:</b> <code>{_name_h(job_name)}</code>")
+        if run_job_now_callback:
+            _submit_run_now(run_job_now_callback, job_name, after=sent)
+
+    def _on_job_del(c, chat_id: int, msg_id: int, arg: str) -> None:
+        """Delete job: confirm."""
+        job_name = _cb_name(arg)
+        if job_name is None:
+            _on_stale_job(chat_id, msg_id)
             return
-        if data.startswith("del_yes:"):
-            job_name = data[7:].strip()
-            if delete_job(job_name):
-                _delete_and_send(bot, chat_id, msg_id, f"✅ <b>Job deleted:</b> <code>{_h(job_name)}</code>", _main_menu_markup())
-            else:
-                _delete_and_send(bot, chat_id, msg_id, f"❌ <b>Job not found:</b> <code>{_h(job_name)}</code>", _main_menu_markup())
+        _set_state(chat_id, _ChatState(flow="del_confirm", job_name=job_name))
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            f"🗑️ <b>Delete job?</b>\nThis will remove <code>{_name_h(job_name)}</code>.",
+            _delete_confirm_markup(job_name),
+        )
+
+    def _on_del_yes(c, chat_id: int, msg_id: int, arg: str) -> None:
+        job_name = _cb_name(arg)
+        if job_name is None:
             _clear_state(chat_id)
-            if send_message_callback:
-                try:
-                    from src.main import get_scheduler_reloader
-                    reloader = get_scheduler_reloader()
-                    if reloader:
-                        reloader()
-                except Exception as e:
-                    send_error(e, "bot: get_scheduler_reloader after del_yes")
+            _on_stale_job(chat_id, msg_id)
             return
+        if delete_job(job_name):
+            _edit_or_send(bot, chat_id, msg_id, f"✅ <b>Job deleted:</b> <code>{_name_h(job_name)}</code>", _MAIN_MENU_MARKUP)
+        else:
+            _edit_or_send(bot, chat_id, msg_id, f"❌ <b>Job not found:</b> <code>{_name_h(job_name)}</code>", _MAIN_MENU_MARKUP)
+        _clear_state(chat_id)
+        if send_message_callback:
+            _schedule_reload()
+
+    def _on_cfg_set_interval(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _set_state(chat_id, _ChatState(flow="cfg", key="PING_DEFAULT_INTERVAL"))
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            "⏱️ <b>Default interval</b>\nSend seconds between packets (e.g. 0.2):",
+            _CANCEL_TO_CFG_MARKUP,
+        )
+
+    def _on_cfg_set_count(c, chat_id: int, msg_id: int, arg: str) -> None:
+        _set_state(chat_id, _ChatState(flow="cfg", key="PING_DEFAULT_COUNT"))
+        _edit_or_send(
+            bot,
+            chat_id,
+            msg_id,
+            "📦 <b>Default count</b>\nSend packets to send by default (e.g. 10):",
+            _CANCEL_TO_CFG_MARKUP,
+        )
+
+    # Callback dispatch on the part before ":" ("job_edit:<key>" -> "job_edit", arg "<key>")
+    handlers: dict[str, Callable] = {
+        "menu_main": _on_menu_main,
+        "menu_jobs": _on_menu_jobs,
+        "menu_cfg": _on_menu_cfg,
+        "menu_help": _on_menu_help,
+        "job_add": _on_job_add,
+        "cfg_set_interval": _on_cfg_set_interval,
+        "cfg_set_count": _on_cfg_set_count,
+        "job_edit": _on_job_edit,
+        "editfield": _on_editfield,
+        "job_run": _on_job_run,
+        "job_del": _on_job_del,
+        "del_yes": _on_del_yes,
+    }
 
-        # Config set
-        if data == "cfg_set_interval":
-            _set_state(chat_id, {"flow": "cfg", "key": "PING_DEFAULT_INTERVAL"})
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                "⏱️ <b>Default interval</b>\nSend seconds between packets (e.g. 0.2):",
-                InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_cfg")),
-            )
+    @bot.callback_query_handler(func=lambda c: True)
+    def on_callback(c):
+        user_id = c.from_user.id
+        if not _is_admin(user_id):
+            if _first_unauth(user_id):
+                _ack(bot, c.id, "Access denied.")
             return
-        if data == "cfg_set_count":
-            _set_state(chat_id, {"flow": "cfg", "key": "PING_DEFAULT_COUNT"})
-            _delete_and_send(
-                bot,
-                chat_id,
-                msg_id,
-                "📦 <b>Default count</b>\nSend packets to send by default (e.g. 10):",
-                InlineKeyboardMarkup().row(InlineKeyboardButton("✖️ Cancel", callback_data="menu_cfg")),
-            )
+        prefix, _, arg = (c.data or "").partition(":")
+        handler = handlers.get(prefix)
+        if handler is None:
+            _ack(bot, c.id)
             return
-
-        try:
-            bot.answer_callback_query(c.id)
-        except Exception as e:
-            send_error(e, "bot: answer_callback_query")
+        if handler is not _on_job_run:  # job run answers with its own "Running…" toast
+            _ack(bot, c.id)
+        handler(c, c.message.chat.id, c.message.message_id, arg)
 
     @bot.message_handler(func=lambda m: True)
     def on_message(msg):
-        if not _is_admin(msg.from_user.id):
-            _reply_html(bot, msg, "🚫 <b>Access denied.</b> This bot is private.")
+        user_id = msg.from_user.id
+        if not _is_admin(user_id):
+            if _first_unauth(user_id):
+                _reply_html(bot, msg, "🚫 <b>Access denied.</b> This bot is private.")
             return
         chat_id = msg.chat.id
         text = (msg.text or "").strip()
         state = _get_state(chat_id)
 
         # Add job: collect name -> target -> interval -> count -> schedule
-        if state and state.get("flow") == "addjob":
-            step = state.get("step", "name")
+        if state and state.flow == "addjob":
+            step = state.step
             if step == "name":
-                if not re.match(r"^[a-zA-Z0-9_. -]+$", text) or len(text) > 32:
+                if not _NAME_RE.match(text):
                     _reply_html(
                         bot,
                         msg,
                         "⚠️ <b>Invalid name.</b> Use letters, numbers, space, <code>_</code>, <code>-</code>, or <code>.</code> (max 32).",
                     )
                     return
-                if get_job_by_name(text):
+                if _lookup_job(text):
                     _reply_html(bot, msg, "⚠️ <b>Name already used.</b> Please choose a different name.")
                     return
-                _set_state(chat_id, {**state, "step": "target", "name": text})
+                _mutate_state(chat_id, step="target", name=text)
                 _reply_html(
                     bot,
                     msg,
@@ -474,7 +896,7 @@ def create_bot(
                 )
                 return
             if step == "target":
-                _set_state(chat_id, {**state, "step": "interval", "target": text})
+                _mutate_state(chat_id, step="interval", target=text)
                 _reply_html(
                     bot,
                     msg,
@@ -482,19 +904,10 @@ def create_bot(
                 )
                 return
             if step == "interval":
-                try:
-                    iv = float(text)
-                    if iv <= 0 or iv > 3600:
-                        raise ValueError("out of range")
-                except ValueError as e:
-                    send_error(e, "bot: add job interval")
-                    _reply_html(
-                        bot,
-                        msg,
-                        "⚠️ <b>Invalid interval.</b> Send a positive number (e.g. 0.01 or 0.2).",
-                    )
+                iv = _parse_field_or_reply(bot, msg, "interval_sec", text)
+                if iv is None:
                     return
-                _set_state(chat_id, {**state, "step": "count", "interval_sec": iv})
+                _mutate_state(chat_id, step="count", interval_sec=iv)
                 _reply_html(
                     bot,
                     msg,
@@ -502,19 +915,10 @@ def create_bot(
                 )
                 return
             if step == "count":
-                try:
-                    cnt = int(text)
-                    if cnt < 1 or cnt > 100000:
-                        raise ValueError("out of range")
-                except ValueError as e:
-                    send_error(e, "bot: add job count")
-                    _reply_html(
-                        bot,
-                        msg,
-                        "⚠️ <b>Invalid count.</b> Send an integer from 1 to 100000.",
-                    )
+                cnt = _parse_field_or_reply(bot, msg, "count", text)
+                if cnt is None:
                     return
-                _set_state(chat_id, {**state, "step": "schedule", "count": cnt})
+                _mutate_state(chat_id, step="schedule", count=cnt)
                 _reply_html(
                     bot,
                     msg,
@@ -522,113 +926,72 @@ def create_bot(
                 )
                 return
             if step == "schedule":
-                try:
-                    sched = int(text)
-                    if sched < 1 or sched > 10080:  # max 1 week
-                        raise ValueError("out of range")
-                except ValueError as e:
-                    send_error(e, "bot: add job schedule")
-                    _reply_html(
-                        bot,
-                        msg,
-                        "⚠️ <b>Invalid schedule.</b> Send minutes between 1 and 10080.",
-                    )
+                sched = _parse_field_or_reply(bot, msg, "schedule_minutes", text)
+                if sched is None:
                     return
                 job = {
-                    "name": state["name"],
-                    "target": state["target"],
-                    "interval_sec": state["interval_sec"],
-                    "count": state["count"],
+                    "name": state.name,
+                    "target": state.target,
+                    "interval_sec": state.interval_sec,
+                    "count": state.count,
                     "schedule_minutes": sched,
                 }
                 if add_job(job):
                     _clear_state(chat_id)
-                    _reply_html(
+                    # One message: confirmation on top of the refreshed jobs list
+                    text2, mk = _jobs_list_with_times()
+                    sent = _send_html_async(
                         bot,
-                        msg,
-                        f"✅ <b>Job added:</b> <code>{_h(job['name'])}</code>\n▶️ Running once now…",
+                        chat_id,
+                        f"✅ <b>Job added:</b> <code>{_name_h(job['name'])}</code>\n▶️ Running once now…\n\n{text2}",
+                        reply_markup=mk,
                     )
                     if run_job_now_callback:
-                        def _run_new_job():
-                            run_job_now_callback(job["name"])
-                        t = threading.Thread(target=_run_new_job, daemon=True)
-                        t.start()
+                        _submit_run_now(run_job_now_callback, job["name"], after=sent)
                     if send_message_callback:
-                        try:
-                            from src.main import get_scheduler_reloader
-                            r = get_scheduler_reloader()
-                            if r:
-                                r()
-                        except Exception as e:
-                            send_error(e, "bot: get_scheduler_reloader after add_job")
-                    text2, mk = _jobs_list_with_times()
-                    _send_html(bot, chat_id, text2, reply_markup=mk)
+                        _schedule_reload()
                 else:
                     _reply_html(bot, msg, "❌ <b>Couldn't add job.</b> The name might already exist.")
                 return
 
         # Edit field
-        if state and state.get("flow") == "edit_field":
-            job_name = state.get("job_name")
-            field = state.get("field")
-            job = get_job_by_name(job_name)
+        if state and state.flow == "edit_field":
+            job_name = state.job_name
+            field = state.field
+            job = _lookup_job(job_name)
             if not job:
                 _clear_state(chat_id)
                 _reply_html(bot, msg, "❌ <b>Job not found.</b>")
                 return
             if field == "target":
                 val = text
-            elif field == "interval_sec":
-                try:
-                    val = float(text)
-                    if val <= 0 or val > 3600:
-                        raise ValueError()
-                except ValueError as e:
-                    send_error(e, "bot: edit field interval_sec")
-                    _reply_html(bot, msg, "⚠️ <b>Invalid interval.</b> Send a positive number (e.g. 0.01).")
-                    return
-            elif field == "count":
-                try:
-                    val = int(text)
-                    if val < 1 or val > 100000:
-                        raise ValueError()
-                except ValueError as e:
-                    send_error(e, "bot: edit field count")
-                    _reply_html(bot, msg, "⚠️ <b>Invalid count.</b> Send an integer from 1 to 100000.")
-                    return
-            elif field == "schedule_minutes":
-                try:
-                    val = int(text)
-                    if val < 1 or val > 10080:
-                        raise ValueError()
-                except ValueError as e:
-                    send_error(e, "bot: edit field schedule_minutes")
-                    _reply_html(bot, msg, "⚠️ <b>Invalid schedule.</b> Send minutes between 1 and 10080.")
+            elif field in _FIELD_SPECS:
+                val = _parse_field_or_reply(bot, msg, field, text)
+                if val is None:
                     return
             else:
                 _clear_state(chat_id)
                 text2, mk = _jobs_list_with_times()
-                _send_html(bot, chat_id, text2, reply_markup=mk)
+                _send_html_async(bot, chat_id, text2, reply_markup=mk)
                 return
             update_job(job_name, {field: val})
             _clear_state(chat_id)
             field_label = _field_label(field)
-            _reply_html(bot, msg, f"✅ <b>Updated:</b> {_h(field_label)}")
             if send_message_callback:
-                try:
-                    from src.main import get_scheduler_reloader
-                    r = get_scheduler_reloader()
-                    if r:
-                        r()
-                except Exception as e:
-                    send_error(e, "bot: get_scheduler_reloader after update_job")
+                _schedule_reload()
+            # Turn the "New value" prompt into the updated jobs list instead of sending two messages
             text2, mk = _jobs_list_with_times()
-            _send_html(bot, chat_id, text2, reply_markup=mk)
+            text2 = f"✅ <b>Updated:</b> {_h(field_label)}\n\n{text2}"
+            menu_msg_id = state.menu_msg_id
+            if menu_msg_id:
+                _edit_or_send(bot, chat_id, menu_msg_id, text2, mk)
+            else:
+                _send_html_async(bot, chat_id, text2, reply_markup=mk)
             return
 
         # Config: set key
-        if state and state.get("flow") == "cfg":
-            key = state.get("key")
+        if state and state.flow == "cfg":
+            key = state.key
             if key == "PING_DEFAULT_INTERVAL":
                 try:
                     float(text)
@@ -646,10 +1009,10 @@ def create_bot(
             _update_env_key(key, text)
             _clear_state(chat_id)
             _reply_html(bot, msg, f"✅ <b>Updated:</b> {_h(_config_label(key))}")
-            _delete_and_send(bot, chat_id, msg.message_id, _config_text(), _config_markup())
+            _delete_and_send(bot, chat_id, msg.message_id, _config_text(), _CONFIG_MARKUP)
             return
 
         # No state: show main menu (do not delete user's message)
-        _send_html(bot, chat_id, "Choose an option below:", reply_markup=_main_menu_markup())
+        _send_html_async(bot, chat_id, "Choose an option below:", reply_markup=_MAIN_MENU_MARKUP)
 
     return bot, send_to_admin
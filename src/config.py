@@ -10,6 +10,7 @@ from src.error_reporting import send_error
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
 _ENV_PATH = _PROJECT_ROOT / ".env"
 _JOBS_PATH = _PROJECT_ROOT / "jobs.json"
+_LAST_RUNS_PATH = _PROJECT_ROOT / "last_runs.json"
 
 load_dotenv(_ENV_PATH)
 
@@ -35,6 +36,21 @@ def _get_float(key: str, default: float) -> float:
         return default
 
 
+def _parse_admin_id(value: str) -> int:
+    # Same rule as validate() (int() accepts e.g. "+42"); 0 never matches a real user
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _get_bool(key: str, default: bool) -> bool:
+    val = _get(key).lower()
+    if not val:
+        return default
+    return val in ("1", "true", "yes", "on")
+
+
 def validate() -> None:
     """Raise if required env vars are missing."""
     token = _get("BOT_TOKEN")
@@ -54,10 +70,24 @@ def validate() -> None:
 BOT_TOKEN: str = _get("BOT_TOKEN", "")
 ADMIN_USER_ID: str = _get("ADMIN_USER_ID", "")
 
+# Parsed once for the per-update admin check and for sending to the admin
+ADMIN_USER_ID_INT: int = _parse_admin_id(ADMIN_USER_ID)
+
 # Optional defaults
 PING_DEFAULT_INTERVAL: float = _get_float("PING_DEFAULT_INTERVAL", 0.2)
 PING_DEFAULT_COUNT: int = _get_int("PING_DEFAULT_COUNT", 10)
 
+# Optional scheduled-report filtering: skip reports whose results match the previous one,
+# but still send every Nth unchanged report as a heartbeat (0 = never)
+REPORT_ONLY_ON_CHANGE: bool = _get_bool("REPORT_ONLY_ON_CHANGE", False)
+REPORT_HEARTBEAT_EVERY: int = _get_int("REPORT_HEARTBEAT_EVERY", 12)
+
+# Optional webhook mode (long polling when WEBHOOK_URL is empty)
+WEBHOOK_URL: str = _get("WEBHOOK_URL", "")
+WEBHOOK_LISTEN: str = _get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT: int = _get_int("WEBHOOK_PORT", 8443)
+WEBHOOK_SECRET: str = _get("WEBHOOK_SECRET", "")
+
 # Paths
 def get_project_root() -> Path:
     return _PROJECT_ROOT
@@ -71,6 +101,10 @@ def get_jobs_path() -> Path:
     return _JOBS_PATH
 
 
+def get_last_runs_path() -> Path:
+    return _LAST_RUNS_PATH
+
+
 def mask_token(token: str) -> str:
     """Return masked token (first 4 + ... + last 4) for display."""
     if not token or len(token) < 12:
@@ -1,6 +1,11 @@
 """Send errors to admin. Call set_send_target() at startup, then send_error() in every except."""
+import atexit
+import queue
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict
 from typing import Callable
 
 # Set from main after bot is created: (send_message_func, admin_chat_id)
@@ -10,6 +15,23 @@ _admin_id: int | None = None
 # Telegram message length limit
 _MAX_MESSAGE_LEN = 4096
 
+# Identical errors (type, message, context) within this window are counted, not re-sent
+_DEDUP_WINDOW_SEC = 30.0
+_DEDUP_MAX_KEYS = 64
+# key -> [window start (monotonic), repeats suppressed in that window]
+_recent: OrderedDict[tuple[str, str, str], list] = OrderedDict()
+_recent_lock = threading.Lock()
+# Fires when the earliest window with suppressed repeats closes, to report their counts
+_repeat_timer: threading.Timer | None = None
+
+# Reports are formatted by the caller and delivered by one daemon thread, so a slow
+# Telegram API never holds up the tick or handler that hit the error
+_ERR_Q: queue.Queue[str] = queue.Queue(maxsize=256)
+_drain_thread: threading.Thread | None = None
+_drain_lock = threading.Lock()
+# Max seconds to wait at exit for queued reports to go out
+_EXIT_DRAIN_SEC = 2.0
+
 
 def set_send_target(send_message_func: Callable[[int, str], None], admin_chat_id: int) -> None:
     """Call once at startup so send_error can deliver to admin."""
@@ -18,23 +40,163 @@ def set_send_target(send_message_func: Callable[[int, str], None], admin_chat_id
     _admin_id = admin_chat_id
 
 
+def _deliver(text: str) -> None:
+    try:
+        if _send_func is not None and _admin_id is not None:
+            _send_func(_admin_id, text)
+        else:
+            print(text, file=sys.stderr)
+    except Exception as e:
+        print(f"send_error failed: {e}", file=sys.stderr)
+        print(text, file=sys.stderr)
+
+
+def _drain() -> None:
+    while True:
+        text = _ERR_Q.get()
+        try:
+            _deliver(text)
+        finally:
+            _ERR_Q.task_done()
+
+
+def _enqueue(text: str) -> None:
+    global _drain_thread
+    if _drain_thread is None:
+        with _drain_lock:
+            if _drain_thread is None:
+                _drain_thread = threading.Thread(target=_drain, name="error-report", daemon=True)
+                _drain_thread.start()
+    try:
+        _ERR_Q.put_nowait(text)
+    except queue.Full:
+        print(text, file=sys.stderr)
+
+
+def _drain_at_exit() -> None:
+    deadline = time.monotonic() + _EXIT_DRAIN_SEC
+    while _ERR_Q.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+atexit.register(_drain_at_exit)
+
+
+def flush_errors() -> None:
+    """Wait briefly for queued reports to go out (for exits that skip atexit)."""
+    _drain_at_exit()
+
+
+def _check_repeat(exc: BaseException, context: str) -> int | None:
+    """
+    Return None if the same error was reported within the window (it is counted instead),
+    else the number of repeats suppressed since it was last reported.
+    """
+    key = (type(exc).__name__, str(exc)[:80], context)
+    now = time.monotonic()
+    with _recent_lock:
+        entry = _recent.get(key)
+        if entry is not None and now - entry[0] < _DEDUP_WINDOW_SEC:
+            entry[1] += 1
+            _arm_repeat_timer_locked(entry[0] + _DEDUP_WINDOW_SEC - now)
+            return None
+        # Normally already reported by the timer; only set if it hasn't fired yet
+        suppressed = entry[1] if entry is not None else 0
+        _recent[key] = [now, 0]
+        _recent.move_to_end(key)
+        while len(_recent) > _DEDUP_MAX_KEYS:
+            _recent.popitem(last=False)
+        return suppressed
+
+
+def _arm_repeat_timer_locked(delay: float) -> None:
+    global _repeat_timer
+    if _repeat_timer is None:
+        _repeat_timer = threading.Timer(max(delay, 0.0), _flush_repeats)
+        _repeat_timer.daemon = True
+        _repeat_timer.start()
+
+
+def _flush_repeats() -> None:
+    """Report the repeat counts of every window that has closed, in one message."""
+    global _repeat_timer
+    now = time.monotonic()
+    lines: list[str] = []
+    with _recent_lock:
+        _repeat_timer = None
+        next_close = None
+        for (type_name, message, context), entry in _recent.items():
+            if not entry[1]:
+                continue
+            closes = entry[0] + _DEDUP_WINDOW_SEC
+            if closes > now:
+                next_close = closes if next_close is None else min(next_close, closes)
+                continue
+            where = f"{context}: " if context else ""
+            lines.append(
+                f"• {where}{type_name}: {message} — x{entry[1]} more within "
+                f"{_DEDUP_WINDOW_SEC:.0f} s of its last report"
+            )
+            entry[1] = 0
+        if next_close is not None:
+            _arm_repeat_timer_locked(next_close - now)
+    if not lines:
+        return
+    text = "\n".join(["Ping Status — Repeated errors", *lines])[:_MAX_MESSAGE_LEN]
+    if _send_func is not None and _admin_id is not None:
+        _enqueue(text)
+    else:
+        print(text, file=sys.stderr)
+
+
+def _format_tb(exc: BaseException, budget: int) -> str:
+    """
+    Format exc's traceback frames, innermost first, until budget chars are used;
+    frames beyond the budget are never formatted. Lines are shown as
+    'File "...", line N, in func' without source text.
+    """
+    frames = list(traceback.walk_tb(exc.__traceback__))
+    if not frames:
+        return ""
+    buf: list[str] = []
+    total = 0
+    for frame, lineno in reversed(frames):
+        code = frame.f_code
+        line = f'  File "{code.co_filename}", line {lineno}, in {code.co_name}\n'
+        total += len(line)
+        if total > budget:
+            buf.append("  … (outer frames truncated)\n")
+            break
+        buf.append(line)
+    buf.append("Traceback (most recent call last):\n")
+    return "".join(reversed(buf))
+
+
 def send_error(exc: BaseException, context: str = "") -> None:
     """
-    Format exception + traceback and send to admin. Call from every except block.
-    If target not set or send fails, prints to stderr.
+    Format exception + traceback and queue it for the admin. Call from every except block.
+    Returns without waiting for Telegram; when 256 reports are already queued the text
+    goes to stderr instead. Repeats of the same error within 30 s of its report are only
+    counted; the counts are reported together when that window closes. If target not set
+    or send fails, prints to stderr.
     """
     try:
+        suppressed = _check_repeat(exc, context)
+        if suppressed is None:
+            return
         lines = ["Ping Status — Error"]
         if context:
             lines.append(f"Context: {context}")
+        if suppressed:
+            lines.append(f"Repeated: x{suppressed} more within {_DEDUP_WINDOW_SEC:.0f} s of its previous report")
         lines.append(f"{type(exc).__name__}: {exc}")
         lines.append("")
-        lines.append(traceback.format_exc())
-        text = "\n".join(lines).strip()
-        if len(text) > _MAX_MESSAGE_LEN:
-            text = text[: _MAX_MESSAGE_LEN - 20] + "\n… (truncated)"
+        header = "\n".join(lines)
+        if len(header) > _MAX_MESSAGE_LEN - 100:
+            header = header[: _MAX_MESSAGE_LEN - 120] + "\n… (truncated)\n"
+        text = (header + _format_tb(exc, _MAX_MESSAGE_LEN - len(header) - 60)).strip()
         if _send_func is not None and _admin_id is not None:
-            _send_func(_admin_id, text)
+            _enqueue(text)
         else:
             print(text, file=sys.stderr)
     except Exception as e:
@@ -1,4 +1,5 @@
 """Thread-safe read/write of jobs.json."""
+import atexit
 import json
 import threading
 from pathlib import Path
@@ -6,8 +7,42 @@ from typing import Any
 
 from src.config import get_jobs_path
 from src.error_reporting import send_error
+from src.fileio import write_atomic
+from src.last_runs_store import delete_last_run
+
+try:
+    import orjson
+
+    def _loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:  # optional; stdlib json is fine for small files
+
+    def _loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
 _LOCK = threading.Lock()
+# Bumped on every successful save so readers can cache load_jobs() results
+_version = 0
+# Saved jobs not yet written to disk (write-behind); None when the file is current
+_pending: list[dict[str, Any]] | None = None
+_flush_timer: threading.Timer | None = None
+_FLUSH_DELAY_SEC = 0.2
+# Delay before retrying a failed flush (e.g. disk full, permissions)
+_FLUSH_RETRY_SEC = 5.0
+# Last parsed jobs.json, keyed by (st_mtime_ns, st_size); None forces a re-read
+_cache_key: tuple[int, int] | None = None
+_cache_jobs: list[dict[str, Any]] = []
+# Set once jobs.json was first read; every later (re)parse or fallback bumps _version
+_loaded = False
+# name -> index into the current list (_pending if set, else _cache_jobs); first match wins
+_by_name: dict[str, int] = {}
 
 JOBS_KEY = "jobs"
 
@@ -16,71 +51,167 @@ def _ensure_file(path: Path) -> None:
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
         if not path.exists():
-            path.write_text(json.dumps({JOBS_KEY: []}, indent=2), encoding="utf-8")
+            path.write_bytes(_dumps({JOBS_KEY: []}))
     except Exception as e:
         send_error(e, "jobs_store: _ensure_file")
 
 
-def load_jobs() -> list[dict[str, Any]]:
-    """Load jobs list from disk. Returns list of job dicts."""
+def _stat_key(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _index(jobs: list[dict[str, Any]]) -> dict[str, int]:
+    by_name: dict[str, int] = {}
+    for i, j in enumerate(jobs):
+        by_name.setdefault(j.get("name"), i)
+    return by_name
+
+
+def _load_locked() -> list[dict[str, Any]]:
+    """
+    Return the live jobs list (pending unsaved changes first, else disk); _by_name indexes it.
+    Caller holds _LOCK. The parsed file is reused until its mtime or size changes, so a
+    steady tick costs one stat().
+    """
+    global _version, _cache_key, _cache_jobs, _by_name, _loaded
+    if _pending is not None:
+        return _pending
     path = get_jobs_path()
+    try:
+        _ensure_file(path)
+        key = _stat_key(path)
+        if key != _cache_key:
+            data = _loads(path.read_bytes())
+            _cache_jobs = data.get(JOBS_KEY, [])
+            _by_name = _index(_cache_jobs)
+            if _loaded:
+                # Edited (or repaired) outside the bot: let version-keyed caches rebuild
+                _version += 1
+            _loaded = True
+            _cache_key = key
+        return _cache_jobs
+    except Exception as e:
+        _cache_key = None
+        _cache_jobs, _by_name = [], {}
+        # Readers must drop what they cached from the last good parse
+        _version += 1
+        _loaded = True
+        send_error(e, "jobs_store: load_jobs")
+        return _cache_jobs
+
+
+def refresh() -> int:
+    """
+    Re-check jobs.json (one stat() when unchanged) so edits made outside the bot bump the
+    version; returns jobs_version(). Call before trusting a version-keyed cache.
+    """
     with _LOCK:
-        try:
-            _ensure_file(path)
-            data = json.loads(path.read_text(encoding="utf-8"))
-            return data.get(JOBS_KEY, [])
-        except Exception as e:
-            send_error(e, "jobs_store: load_jobs")
-            return []
+        _load_locked()
+        return _version
+
+
+def load_jobs() -> list[dict[str, Any]]:
+    """Load jobs list (pending unsaved changes first, else disk). Returns list of job dicts."""
+    with _LOCK:
+        return list(_load_locked())
+
+
+def _save_locked(jobs: list[dict[str, Any]], by_name: dict[str, int] | None = None) -> None:
+    """Make jobs the live list and schedule the disk write. Caller holds _LOCK."""
+    global _version, _pending, _by_name
+    _pending = jobs
+    _by_name = by_name if by_name is not None else _index(jobs)
+    _version += 1
+    if _flush_timer is None:
+        _arm_flush_locked(_FLUSH_DELAY_SEC)
+
+
+def _arm_flush_locked(delay: float) -> None:
+    global _flush_timer
+    _flush_timer = threading.Timer(delay, flush_jobs)
+    _flush_timer.daemon = True
+    _flush_timer.start()
 
 
 def save_jobs(jobs: list[dict[str, Any]]) -> None:
-    """Write jobs list to disk."""
+    """
+    Save jobs list. The disk write is deferred by up to 200 ms so a burst of
+    changes costs one write; load_jobs() sees the new list immediately.
+    """
+    with _LOCK:
+        _save_locked(list(jobs))
+
+
+def flush_jobs() -> None:
+    """Write pending jobs to disk now (also runs at exit)."""
+    global _pending, _flush_timer, _cache_key, _cache_jobs
     path = get_jobs_path()
     with _LOCK:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if _pending is None:
+            return
         try:
-            _ensure_file(path)
-            path.write_text(json.dumps({JOBS_KEY: jobs}, indent=2), encoding="utf-8")
+            write_atomic(path, _dumps({JOBS_KEY: _pending}))
+            _cache_jobs, _cache_key = _pending, _stat_key(path)
+            _pending = None
         except Exception as e:
-            send_error(e, "jobs_store: save_jobs")
-            raise
+            _cache_key = None
+            # Keep the pending list and try again shortly (a later save or exit also retries)
+            _arm_flush_locked(_FLUSH_RETRY_SEC)
+            send_error(e, "jobs_store: flush_jobs")
+
+
+atexit.register(flush_jobs)
+
+
+def jobs_version() -> int:
+    """Return a counter that changes whenever jobs are saved."""
+    return _version
 
 
 def get_job_by_name(name: str) -> dict[str, Any] | None:
     """Return first job with given name or None."""
-    for j in load_jobs():
-        if j.get("name") == name:
-            return j
-    return None
+    with _LOCK:
+        jobs = _load_locked()
+        i = _by_name.get(name)
+        return jobs[i] if i is not None else None
 
 
 def add_job(job: dict[str, Any]) -> bool:
     """Add job if name is unique. Returns True if added."""
-    jobs = load_jobs()
-    names = {j.get("name") for j in jobs}
-    if job.get("name") in names:
-        return False
-    jobs.append(job)
-    save_jobs(jobs)
+    name = job.get("name")
+    with _LOCK:
+        jobs = _load_locked()
+        if name in _by_name:
+            return False
+        jobs.append(job)
+        _by_name[name] = len(jobs) - 1
+        _save_locked(jobs, _by_name)
     return True
 
 
 def update_job(name: str, updates: dict[str, Any]) -> bool:
     """Update first job with given name. Returns True if found."""
-    jobs = load_jobs()
-    for i, j in enumerate(jobs):
-        if j.get("name") == name:
-            jobs[i] = {**j, **updates}
-            save_jobs(jobs)
-            return True
-    return False
+    with _LOCK:
+        jobs = _load_locked()
+        i = _by_name.get(name)
+        if i is None:
+            return False
+        # Replace rather than mutate: readers may still hold the old dict
+        jobs[i] = {**jobs[i], **updates}
+        _save_locked(jobs, _by_name)
+    return True
 
 
 def delete_job(name: str) -> bool:
-    """Remove first job with given name. Returns True if removed."""
-    jobs = load_jobs()
-    new_jobs = [j for j in jobs if j.get("name") != name]
-    if len(new_jobs) == len(jobs):
-        return False
-    save_jobs(new_jobs)
+    """Remove all jobs with given name. Returns True if removed."""
+    with _LOCK:
+        jobs = _load_locked()
+        if name not in _by_name:
+            return False
+        _save_locked([j for j in jobs if j.get("name") != name])
+    delete_last_run(name)
     return True
@@ -0,0 +1,67 @@
+"""Thread-safe read/write of last_runs.json ({job_name: last_run_at ISO})."""
+import json
+import threading
+
+from src.config import get_last_runs_path
+from src.error_reporting import send_error
+from src.fileio import write_atomic
+
+_LOCK = threading.Lock()
+# Loaded on first use; None until then
+_runs: dict[str, str] | None = None
+# Bumped on every change so readers can cache derived schedules
+_version = 0
+
+
+def _load_locked() -> dict[str, str]:
+    global _runs
+    if _runs is None:
+        path = get_last_runs_path()
+        try:
+            _runs = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        except Exception as e:
+            send_error(e, "last_runs_store: load")
+            _runs = {}
+    return _runs
+
+
+def _write_locked(runs: dict[str, str]) -> None:
+    write_atomic(get_last_runs_path(), json.dumps(runs, separators=(",", ":")).encode("utf-8"))
+
+
+def get_last_runs() -> dict[str, str]:
+    """Return {job_name: last_run_at ISO} (a copy)."""
+    with _LOCK:
+        return dict(_load_locked())
+
+
+def last_runs_version() -> int:
+    """Return a counter that changes whenever a last run is recorded or cleared."""
+    return _version
+
+
+def set_last_run(name: str, iso: str) -> None:
+    """Record when job name last ran; jobs.json is not touched."""
+    global _version
+    with _LOCK:
+        runs = _load_locked()
+        runs[name] = iso
+        _version += 1
+        try:
+            _write_locked(runs)
+        except Exception as e:
+            send_error(e, "last_runs_store: set_last_run")
+
+
+def delete_last_run(name: str) -> None:
+    """Forget job name's last run (so a re-created job with that name starts fresh)."""
+    global _version
+    with _LOCK:
+        runs = _load_locked()
+        if runs.pop(name, None) is None:
+            return
+        _version += 1
+        try:
+            _write_locked(runs)
+        except Exception as e:
+            send_error(e, "last_runs_store: delete_last_run")
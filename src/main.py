@@ -1,10 +1,16 @@
-"""Entry point: load .env, start bot and scheduler."""
+"""Entry point: load .env, start bot (long polling or webhook) and scheduler."""
+import importlib.util
+import os
+import signal
 import sys
 import traceback
+from urllib.parse import urlparse
 
-from src.config import ADMIN_USER_ID, validate
-from src.bot import create_bot
-from src.error_reporting import send_error, set_send_target
+from src import config
+from src.config import ADMIN_USER_ID_INT, validate
+from src.bot import create_bot, flush_pending_deletes, set_scheduler_reloader, shutdown_pools
+from src.error_reporting import flush_errors, send_error, set_send_target
+from src.jobs_store import flush_jobs
 from src.scheduler import get_next_run_times, reload_scheduler, run_job_now, start_scheduler
 
 _scheduler = None
@@ -14,7 +20,7 @@ _send_message_func = None
 def _reload_scheduler() -> None:
     global _scheduler, _send_message_func
     if _scheduler and _send_message_func:
-        reload_scheduler(_scheduler, _send_message_func, int(ADMIN_USER_ID))
+        reload_scheduler(_scheduler, _send_message_func, ADMIN_USER_ID_INT)
 
 
 def get_scheduler_reloader():
@@ -22,9 +28,36 @@ def get_scheduler_reloader():
     return _reload_scheduler
 
 
+def _webhook_paths(url: str, token: str) -> tuple[str, str]:
+    """
+    Return (url_path, webhook_url) for run_webhooks so the listener serves the path Telegram
+    POSTs to. telebot serves "/<url_path>/" (trailing slash added), so the registered URL gets
+    the same trailing slash; a URL without a path uses telebot's default "/<token>/".
+    """
+    parsed = urlparse(url)
+    path = parsed.path.strip("/") or token
+    return path, parsed._replace(path=f"/{path}/").geturl()
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    # Default SIGTERM (systemctl stop/restart) kills without running finally/atexit, which
+    # would drop jobs.json writes and message deletes still buffered; exit cleanly instead
+    raise SystemExit(0)
+
+
+def _hard_exit(code: int) -> None:
+    # Jobs and deletes are flushed by now; a normal interpreter exit would still join every
+    # pool worker, so an in-flight ping (up to 1000 packets) would stall stop/restart
+    flush_errors()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
 def main() -> None:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
     validate()
-    admin_id = int(ADMIN_USER_ID)
+    admin_id = ADMIN_USER_ID_INT
 
     def _get_next_times():
         return get_next_run_times()
@@ -42,16 +75,43 @@ def main() -> None:
         bot.send_message(chat_id, text, parse_mode="HTML")
     global _send_message_func, _scheduler
     _send_message_func = _send_html
+    set_scheduler_reloader(get_scheduler_reloader())
     set_send_target(bot.send_message, admin_id)
     _scheduler = start_scheduler(_send_message_func, admin_id)
     try:
-        bot.infinity_polling()
+        # Open the pooled TLS connection now so the first button press doesn't pay the handshake
+        bot.get_me()
+    except Exception as e:
+        send_error(e, "main: get_me prewarm")
+    try:
+        if config.WEBHOOK_URL:
+            # Check before run_webhooks: it registers the webhook with Telegram before importing these
+            missing = [m for m in ("fastapi", "uvicorn") if importlib.util.find_spec(m) is None]
+            if missing:
+                raise SystemExit(f"WEBHOOK_URL is set but {', '.join(missing)} is not installed")
+            # Push-driven updates; telebot checks the X-Telegram-Bot-Api-Secret-Token header
+            url_path, webhook_url = _webhook_paths(config.WEBHOOK_URL, config.BOT_TOKEN)
+            bot.run_webhooks(
+                listen=config.WEBHOOK_LISTEN,
+                port=config.WEBHOOK_PORT,
+                url_path=url_path,
+                webhook_url=webhook_url,
+                secret_token=config.WEBHOOK_SECRET or None,
+                drop_pending_updates=True,
+            )
+        else:
+            # A webhook left over from an earlier webhook-mode run makes getUpdates fail with 409
+            bot.remove_webhook()
+            bot.infinity_polling()
     except KeyboardInterrupt:
         pass
     except Exception as e:
         send_error(e, "main: infinity_polling")
         raise
     finally:
+        flush_pending_deletes(bot)
+        flush_jobs()
+        shutdown_pools()
         if _scheduler:
             _scheduler.shutdown(wait=False)
 
@@ -59,12 +119,13 @@ def main() -> None:
 if __name__ == "__main__":
     try:
         main()
-        sys.exit(0)
+        exit_code = 0
     except SystemExit as e:
         if e.code and e.code != 0:
             print(e, file=sys.stderr)
-        sys.exit(e.code if isinstance(e.code, int) else 1)
+        exit_code = e.code if isinstance(e.code, int) else 1
     except Exception as e:
         send_error(e, "main: uncaught")
         traceback.print_exc(file=sys.stderr)
-        sys.exit(1)
+        exit_code = 1
+    _hard_exit(exit_code)
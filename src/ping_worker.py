@@ -1,12 +1,26 @@
-"""Run ping -c <count> -i <interval_sec> <target> and parse output."""
+"""Ping a target via an ICMP datagram socket, or ping -c <count> -i <interval_sec> <target>."""
+import functools
+import math
+import os
 import re
+import select
+import socket
+import struct
 import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from html import escape
-from typing import Optional
+from typing import Callable, Optional
 
 from src.error_reporting import send_error
 
+try:
+    import icmplib
+except ImportError:  # optional; without it run_pings runs run_ping per target
+    icmplib = None
+
 
 @dataclass
 class PingResult:
@@ -25,24 +39,185 @@ class PingResult:
     error: Optional[str] = None
 
 
-# Linux ping summary line: "rtt min/avg/max/mdev = 1.234/5.678/9.012/2.345 ms"
-_RTT_RE = re.compile(
-    r"rtt min/avg/max/mdev = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms",
-    re.IGNORECASE,
-)
-# "X packets transmitted, Y received, Z% packet loss"
-_STATS_RE = re.compile(
-    r"(\d+) packets? transmitted, (\d+) (?:received|received)",
+# Linux ping summary, matched in one pass; m.lastgroup tells which part matched:
+#   "X packets transmitted, Y received, Z% packet loss"
+#   "rtt min/avg/max/mdev = 1.234/5.678/9.012/2.345 ms"
+_SUMMARY_RE = re.compile(
+    r"(?P<tx>\d+) packets? transmitted, (?P<rx>\d+) received"
+    r"|(?P<loss>\d+(?:\.\d+)?)% packet loss"
+    r"|rtt min/avg/max/mdev = (?P<mn>[\d.]+)/(?P<avg>[\d.]+)/(?P<mx>[\d.]+)/(?P<md>[\d.]+) ms",
     re.IGNORECASE,
 )
-_LOSS_RE = re.compile(r"(\d+(?:\.\d+)?)% packet loss", re.IGNORECASE)
+# Bytes of stdout to scan when the statistics marker line is missing
+_TAIL_BYTES = 512
+
+
+# icmplib waits for each reply in turn, up to this many seconds, before the next request
+_REPLY_TIMEOUT_SEC = 2.0
+# ping's default linger (-W): how long to wait after the last request when nothing came back
+_LINGER_SEC = 10.0
+# Sequence numbers are 16-bit; longer runs would match late replies to the wrong request
+_MAX_ICMP_COUNT = 0xFFFF
+# None until the first attempt; False once the kernel refuses ICMP datagram sockets
+_icmp_available: bool | None = None
+# Ping tasks run side by side in run_pings (they mostly wait on replies), up to this many
+_MAX_CONCURRENT_PINGS = 16
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _reply_wait(interval_sec: float, rtts: list[float]) -> float:
+    """
+    Seconds to wait for outstanding replies after the last request, as iputils ping does:
+    twice the slowest round trip so far (at least one interval), or the linger time if none.
+    """
+    if rtts:
+        return max(2 * max(rtts) / 1000.0, interval_sec)
+    return _LINGER_SEC
+
+
+def _icmp_sockets_allowed() -> bool:
+    """Whether the kernel lets this process open ICMP datagram sockets (probed once)."""
+    global _icmp_available
+    if _icmp_available is None:
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+            _icmp_available = True
+        except OSError:
+            _icmp_available = False
+    return _icmp_available
+
+
+def _icmp_ping(target: str, count: int, interval_sec: float) -> PingResult | None:
+    """
+    Ping over an unprivileged ICMP datagram socket (Linux net.ipv4.ping_group_range),
+    with no fork/exec and no output parsing. Returns None when such sockets are not
+    permitted, the target has no IPv4 address or count exceeds the 16-bit sequence space,
+    so the caller falls back to ping.
+    """
+    global _icmp_available
+    if _icmp_available is False or count > _MAX_ICMP_COUNT:
+        return None
+    try:
+        addr = socket.getaddrinfo(target, None, socket.AF_INET)[0][4][0]
+    except OSError:
+        return None
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        _icmp_available = False
+        return None
+    _icmp_available = True
+
+    payload = os.urandom(8)
+    sent_at: dict[int, float] = {}
+    rtts: list[float] = []
+    errors: list[str] = []
+    transmitted = 0
+    with sock:
+        next_send = time.monotonic()
+        deadline = None
+        while True:
+            now = time.monotonic()
+            if transmitted < count and now >= next_send:
+                seq = transmitted & 0xFFFF
+                # The kernel fills in the identifier for datagram ICMP sockets
+                header = struct.pack("!BBHHH", 8, 0, 0, 0, seq)
+                packet = struct.pack("!BBHHH", 8, 0, _checksum(header + payload), 0, seq) + payload
+                try:
+                    sock.sendto(packet, (addr, 0))
+                    sent_at[seq] = time.monotonic()
+                except OSError as e:
+                    errors.append(e.strerror or str(e))
+                transmitted += 1
+                next_send += interval_sec
+                if transmitted == count:
+                    deadline = time.monotonic() + _reply_wait(interval_sec, rtts)
+                continue
+            if deadline is not None and (not sent_at or now >= deadline):
+                break
+            wait = (deadline if deadline is not None else next_send) - now
+            ready, _, _ = select.select([sock], [], [], max(wait, 0))
+            if not ready:
+                continue
+            reply = sock.recv(1024)
+            received_at = time.monotonic()
+            if len(reply) < 8 or reply[0] != 0:
+                continue
+            sent = sent_at.pop(struct.unpack("!H", reply[6:8])[0], None)
+            if sent is not None:
+                rtts.append((received_at - sent) * 1000.0)
+
+    return _result_from_rtts(target, count, interval_sec, transmitted, rtts, errors[0] if errors else None)
+
+
+def _result_from_rtts(
+    target: str,
+    count: int,
+    interval_sec: float,
+    transmitted: int,
+    rtts: list[float],
+    error: str | None = None,
+) -> PingResult:
+    """Build a PingResult (ping-style min/avg/max/mdev) from round-trip times in ms."""
+    received = len(rtts)
+    rtt_min = rtt_avg = rtt_max = rtt_mdev = None
+    raw_summary = ""
+    if rtts:
+        rtt_min, rtt_max = min(rtts), max(rtts)
+        rtt_avg = sum(rtts) / received
+        rtt_mdev = math.sqrt(max(sum(r * r for r in rtts) / received - rtt_avg * rtt_avg, 0.0))
+        raw_summary = (
+            f"rtt min/avg/max/mdev = {rtt_min:.3f}/{rtt_avg:.3f}/{rtt_max:.3f}/{rtt_mdev:.3f} ms"
+        )
+    return PingResult(
+        target=target,
+        count=count,
+        interval_sec=interval_sec,
+        transmitted=transmitted,
+        received=received,
+        loss_pct=100.0 * (1 - received / transmitted) if transmitted else 100.0,
+        rtt_min_ms=rtt_min,
+        rtt_avg_ms=rtt_avg,
+        rtt_max_ms=rtt_max,
+        rtt_mdev_ms=rtt_mdev,
+        raw_summary=raw_summary,
+        error=error,
+    )
 
 
 def run_ping(target: str, count: int, interval_sec: float) -> PingResult:
     """
-    Run ping -c <count> -i <interval_sec> <target> and return parsed result.
-    On Linux, interval < 0.2 may require root.
+    Ping target count times, interval_sec apart, and return the result.
+    Uses an ICMP datagram socket when the kernel allows it; otherwise runs
+    ping -c <count> -i <interval_sec> <target>, where interval < 0.2 may require root.
     """
+    if count < 1:
+        # Nothing to send (e.g. a hand-edited jobs.json); the socket loop needs at least one packet
+        return PingResult(
+            target=target,
+            count=count,
+            interval_sec=interval_sec,
+            transmitted=0,
+            received=0,
+            loss_pct=100.0,
+            error=f"Invalid packet count: {count}",
+        )
+    try:
+        result = _icmp_ping(target, count, interval_sec)
+    except Exception as e:
+        send_error(e, "ping_worker: _icmp_ping")
+        result = None
+    if result is not None:
+        return result
+
     cmd = ["ping", "-c", str(count), "-i", str(interval_sec), target]
     try:
         proc = subprocess.run(
@@ -90,6 +265,64 @@ def run_ping(target: str, count: int, interval_sec: float) -> PingResult:
     return _parse_ping_output(target, count, interval_sec, stdout, stderr)
 
 
+def _multiping(targets: list[str], count: int, interval_sec: float) -> list[PingResult]:
+    """Ping several targets with the same count/interval in one icmplib.multiping call."""
+    global _icmp_available
+    try:
+        hosts = icmplib.multiping(
+            targets,
+            count=count,
+            interval=interval_sec,
+            timeout=_REPLY_TIMEOUT_SEC,
+            privileged=False,
+        )
+    except icmplib.SocketPermissionError:
+        _icmp_available = False
+        return [run_ping(t, count, interval_sec) for t in targets]
+    except Exception as e:
+        # e.g. one unresolvable name fails the whole batch; ping each target on its own
+        send_error(e, "ping_worker: _multiping")
+        return [run_ping(t, count, interval_sec) for t in targets]
+    return [
+        _result_from_rtts(t, count, interval_sec, h.packets_sent, list(h.rtts))
+        for t, h in zip(targets, hosts)
+    ]
+
+
+def run_pings(specs: list[tuple[str, int, float]]) -> list[PingResult]:
+    """
+    Ping several (target, count, interval_sec) specs concurrently; results keep the input order.
+    With icmplib installed, specs sharing count and interval go out in one multiping call;
+    the rest (or everything, without icmplib) run through run_ping.
+    """
+    results: list[PingResult | None] = [None] * len(specs)
+    tasks: list[tuple[list[int], Callable[[], list[PingResult]]]] = []
+    if icmplib is not None and _icmp_sockets_allowed():
+        groups: dict[tuple[int, float], list[int]] = defaultdict(list)
+        for i, (_, count, interval_sec) in enumerate(specs):
+            groups[(count, interval_sec)].append(i)
+        for (count, interval_sec), idxs in groups.items():
+            if len(idxs) > 1 and 1 <= count <= _MAX_ICMP_COUNT:
+                targets = [specs[i][0] for i in idxs]
+                tasks.append((idxs, lambda t=targets, c=count, iv=interval_sec: _multiping(t, c, iv)))
+            else:
+                tasks.append((idxs, lambda s=specs[idxs[0]]: [run_ping(*s)]))
+    else:
+        tasks = [([i], lambda s=spec: [run_ping(*s)]) for i, spec in enumerate(specs)]
+    if len(tasks) == 1:
+        outputs = [tasks[0][1]()]
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(len(tasks), _MAX_CONCURRENT_PINGS) or 1,
+            thread_name_prefix="ping",
+        ) as pool:
+            outputs = list(pool.map(lambda task: task[1](), tasks))
+    for (idxs, _), out in zip(tasks, outputs):
+        for i, result in zip(idxs, out):
+            results[i] = result
+    return results
+
+
 def _parse_ping_output(
     target: str,
     count: int,
@@ -103,31 +336,43 @@ def _parse_ping_output(
     rtt_min = rtt_avg = rtt_max = rtt_mdev = None
     raw_summary = ""
 
+    # The summary follows the "--- <target> ping statistics ---" line at the end;
+    # per-reply lines before it grow with count and are never needed.
+    marker = stdout.rfind("--- ")
+    tail = stdout[marker:] if marker != -1 else stdout[-_TAIL_BYTES:]
+
+    stats_match = loss_match = rtt_match = None
+    for m in _SUMMARY_RE.finditer(tail):
+        kind = m.lastgroup
+        if kind == "rx":
+            stats_match = stats_match or m
+        elif kind == "loss":
+            loss_match = loss_match or m
+        elif rtt_match is None:
+            rtt_match = m
+
     # Packet stats: "3 packets transmitted, 3 received, 0% packet loss"
-    stats_match = _STATS_RE.search(stdout)
     if stats_match:
-        transmitted = int(stats_match.group(1))
-        received = int(stats_match.group(2))
-    loss_match = _LOSS_RE.search(stdout)
+        transmitted = int(stats_match["tx"])
+        received = int(stats_match["rx"])
     if loss_match:
-        loss_pct = float(loss_match.group(1))
+        loss_pct = float(loss_match["loss"])
     elif transmitted > 0:
         loss_pct = 100.0 * (1 - received / transmitted)
 
     # RTT line
-    rtt_match = _RTT_RE.search(stdout)
     if rtt_match:
-        rtt_min = float(rtt_match.group(1))
-        rtt_avg = float(rtt_match.group(2))
-        rtt_max = float(rtt_match.group(3))
-        rtt_mdev = float(rtt_match.group(4))
+        rtt_min = float(rtt_match["mn"])
+        rtt_avg = float(rtt_match["avg"])
+        rtt_max = float(rtt_match["mx"])
+        rtt_mdev = float(rtt_match["md"])
         raw_summary = rtt_match.group(0)
 
     # Fallback: use last line as raw summary if no RTT parsed
-    if not raw_summary and stdout.strip():
-        lines = [l.strip() for l in stdout.strip().splitlines() if l.strip()]
-        if lines:
-            raw_summary = lines[-1]
+    if not raw_summary:
+        stripped = tail.strip()
+        if stripped:
+            raw_summary = stripped.rsplit("\n", 1)[-1].strip()
 
     return PingResult(
         target=target,
@@ -145,43 +390,80 @@ def _parse_ping_output(
     )
 
 
+def _h(value: object) -> str:
+    return escape(str(value), quote=False)
+
+
+def _fmt_num(value: float, digits: int = 2) -> str:
+    return f"{value:.{digits}f}".rstrip("0").rstrip(".")
+
+
+# Report layout: one format_map pass per report (fields are pre-escaped)
+_REPORT_HEAD = (
+    "<b>📡 Ping Report — {name}</b>\n"
+    "\n"
+    "🎯 <b>Target:</b> {target}\n"
+    "📦 <b>Test:</b> {count} packets (interval {interval}s)\n"
+    "\n"
+    "📊 <b>Results:</b>\n"
+    "• <b>Sent:</b> {sent}\n"
+    "• <b>Received:</b> {received}\n"
+    "• <b>Packet Loss:</b> {loss:.1f}%\n"
+    "\n"
+)
+_REPORT_WITH_RTT = _REPORT_HEAD + (
+    "⏱ <b>Latency (RTT):</b>\n"
+    "• <b>Min:</b> {min} ms\n"
+    "• <b>Avg:</b> {avg} ms\n"
+    "• <b>Max:</b> {max} ms{jitter}{note}"
+)
+_REPORT_WITHOUT_RTT = _REPORT_HEAD + "{latency}{note}"
+
+
 def format_report(job_name: str, result: PingResult) -> str:
     """Format a detailed report string for Telegram (HTML)."""
+    r = result
+    return _format_report_cached(
+        job_name, r.target, r.count, r.interval_sec, r.transmitted, r.received, r.loss_pct,
+        r.rtt_min_ms, r.rtt_avg_ms, r.rtt_max_ms, r.rtt_mdev_ms, r.raw_summary, r.error,
+    )
 
-    def _h(value: object) -> str:
-        return escape(str(value), quote=False)
-
-    def _fmt_num(value: float, digits: int = 2) -> str:
-        return f"{value:.{digits}f}".rstrip("0").rstrip(".")
-
-    interval = _fmt_num(result.interval_sec, 3)
-    lines = [
-        f"<b>📡 Ping Report — {_h(job_name)}</b>",
-        "",
-        f"🎯 <b>Target:</b> {_h(result.target)}",
-        f"📦 <b>Test:</b> {result.count} packets (interval {interval}s)",
-        "",
-        "📊 <b>Results:</b>",
-        f"• <b>Sent:</b> {result.transmitted}",
-        f"• <b>Received:</b> {result.received}",
-        f"• <b>Packet Loss:</b> {result.loss_pct:.1f}%",
-    ]
-    if result.rtt_min_ms is not None and result.rtt_avg_ms is not None and result.rtt_max_ms is not None:
-        lines.extend(
-            [
-                "",
-                "⏱ <b>Latency (RTT):</b>",
-                f"• <b>Min:</b> {_fmt_num(result.rtt_min_ms)} ms",
-                f"• <b>Avg:</b> {_fmt_num(result.rtt_avg_ms)} ms",
-                f"• <b>Max:</b> {_fmt_num(result.rtt_max_ms)} ms",
-            ]
-        )
-        if result.rtt_mdev_ms is not None:
-            lines.append(f"• <b>Jitter:</b> {_fmt_num(result.rtt_mdev_ms)} ms")
-    elif result.raw_summary:
-        lines.extend(["", f"ℹ️ <b>Summary:</b> {_h(result.raw_summary)}"])
+
+@functools.lru_cache(maxsize=128)
+def _format_report_cached(
+    job_name: str,
+    target: str,
+    count: int,
+    interval_sec: float,
+    transmitted: int,
+    received: int,
+    loss_pct: float,
+    rtt_min_ms: float | None,
+    rtt_avg_ms: float | None,
+    rtt_max_ms: float | None,
+    rtt_mdev_ms: float | None,
+    raw_summary: str,
+    error: str | None,
+) -> str:
+    """format_report on the flattened result, so repeated identical reports skip escaping/joining."""
+    fields = {
+        "name": _h(job_name),
+        "target": _h(target),
+        "count": count,
+        "interval": _fmt_num(interval_sec, 3),
+        "sent": transmitted,
+        "received": received,
+        "loss": loss_pct,
+        "note": f"\n\n⚠️ <b>Note:</b> {_h(error)}" if error else "",
+    }
+    if rtt_min_ms is not None and rtt_avg_ms is not None and rtt_max_ms is not None:
+        fields["min"] = _fmt_num(rtt_min_ms)
+        fields["avg"] = _fmt_num(rtt_avg_ms)
+        fields["max"] = _fmt_num(rtt_max_ms)
+        fields["jitter"] = f"\n• <b>Jitter:</b> {_fmt_num(rtt_mdev_ms)} ms" if rtt_mdev_ms is not None else ""
+        return _REPORT_WITH_RTT.format_map(fields)
+    if raw_summary:
+        fields["latency"] = f"ℹ️ <b>Summary:</b> {_h(raw_summary)}"
     else:
-        lines.extend(["", "ℹ️ <b>Latency:</b> Not available"])
-    if result.error:
-        lines.extend(["", f"⚠️ <b>Note:</b> {_h(result.error)}"])
-    return "\n".join(lines)
+        fields["latency"] = "ℹ️ <b>Latency:</b> Not available"
+    return _REPORT_WITHOUT_RTT.format_map(fields)
@@ -1,4 +1,6 @@
 """Job scheduler: check every 10s and run jobs when next_run (last_run + schedule) has passed."""
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from html import escape
 from typing import Callable
@@ -6,21 +8,39 @@ from typing import Callable
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
+from src import config as config_module
 from src.error_reporting import send_error
-from src.jobs_store import load_jobs, update_job
-from src.ping_worker import PingResult, format_report, run_ping
+from src.jobs_store import load_jobs, refresh
+from src.last_runs_store import get_last_runs, last_runs_version, set_last_run
+from src.ping_worker import PingResult, format_report, run_ping, run_pings
 
 # Callback: (admin_user_id: int, text: str) -> None
 SendMessageFunc = Callable[[int, str], None]
 
 _TICK_JOB_ID = "ping_tick"
 _CHECK_INTERVAL_SEC = 10
+_NS_PER_MINUTE = 60_000_000_000
+# job name -> (fingerprint of the last report sent, unchanged runs skipped since); the tick
+# and "Run now" can report the same job at once, so reads and writes hold the lock.
+# Entries for jobs that are gone or have never run are dropped when the schedule is rebuilt
+_last_reports: dict[str, tuple[tuple, int]] = {}
+_last_reports_lock = threading.Lock()
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+# ((jobs_version, last_runs_version), [(job, next run in epoch ns, or None if never run)])
+_schedule_cache: tuple[tuple[int, int], list[tuple[dict, int | None]]] = ((-1, -1), [])
 
 
 def _parse_last_run(iso_str: str | None) -> datetime | None:
     """Parse last_run_at ISO string to timezone-aware datetime. Returns None if missing/invalid."""
     if not iso_str:
         return None
+    # Fast path for what _run_job writes ("...+00:00"): already aware, no strip/replace copies
+    if iso_str.endswith("+00:00"):
+        try:
+            return datetime.fromisoformat(iso_str)
+        except ValueError:
+            pass  # let the general path below report it
     try:
         s = (iso_str or "").strip().replace("Z", "+00:00")
         dt = datetime.fromisoformat(s)
@@ -32,39 +52,113 @@ def _parse_last_run(iso_str: str | None) -> datetime | None:
         return None
 
 
-def _run_job(job: dict, send_message: SendMessageFunc, admin_user_id: int) -> None:
-    """Run one ping job and send report to admin."""
+def _ns_to_datetime(ns: int) -> datetime:
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc)
+
+
+def _scheduled_jobs() -> list[tuple[dict, int | None]]:
+    """Jobs paired with their due time; last runs are parsed only after jobs or last runs change."""
+    global _schedule_cache
+    # refresh() stats jobs.json, so out-of-band edits are picked up on the next tick
+    version = (refresh(), last_runs_version())
+    if _schedule_cache[0] == version:
+        return _schedule_cache[1]
+    runs = get_last_runs()
+    entries: list[tuple[dict, int | None]] = []
+    ran: set[str] = set()
+    for job in load_jobs():
+        # last_run_at inside jobs.json is from before last_runs.json existed
+        last_run = _parse_last_run(runs.get(job.get("name")) or job.get("last_run_at"))
+        if last_run is None:
+            entries.append((job, None))
+        else:
+            schedule_minutes = max(1, int(job.get("schedule_minutes", 5)))
+            last_run_ns = (last_run - _EPOCH) // _ONE_US * 1000
+            entries.append((job, last_run_ns + schedule_minutes * _NS_PER_MINUTE))
+            ran.add(job.get("name"))
+    # A deleted job (or one deleted and re-added: delete clears its last run) starts fresh
+    with _last_reports_lock:
+        for name in [n for n in _last_reports if n not in ran]:
+            del _last_reports[name]
+    _schedule_cache = (version, entries)
+    return entries
+
+
+def _job_spec(job: dict) -> tuple[str, int, float]:
+    """(target, count, interval_sec) for a job, with the defaults used when fields are missing."""
+    return job.get("target", ""), int(job.get("count", 10)), float(job.get("interval_sec", 0.2))
+
+
+def _should_report(name: str, result: PingResult, scheduled: bool) -> bool:
+    """
+    With REPORT_ONLY_ON_CHANGE, a scheduled report is skipped when its loss/avg-RTT
+    fingerprint matches the last report sent for the job, except every
+    REPORT_HEARTBEAT_EVERY-th skip. "Run now" reports are always sent.
+    """
+    if not config_module.REPORT_ONLY_ON_CHANGE:
+        return True
+    avg = result.rtt_avg_ms
+    fp = (round(result.loss_pct), round(avg) if avg is not None else -1, result.error)
+    with _last_reports_lock:
+        prev = _last_reports.get(name)
+        if scheduled and prev is not None and prev[0] == fp:
+            skipped = prev[1] + 1
+            every = config_module.REPORT_HEARTBEAT_EVERY
+            if every <= 0 or skipped < every:
+                _last_reports[name] = (fp, skipped)
+                return False
+        _last_reports[name] = (fp, 0)
+        return True
+
+
+def _run_job(
+    job: dict,
+    send_message: SendMessageFunc,
+    admin_user_id: int,
+    result: PingResult | None = None,
+    *,
+    scheduled: bool = False,
+) -> None:
+    """Run one ping job (unless result was already measured) and send report to admin."""
     try:
         name = job.get("name", "?")
-        target = job.get("target", "")
-        count = int(job.get("count", 10))
-        interval_sec = float(job.get("interval_sec", 0.2))
+        target, count, interval_sec = _job_spec(job)
         if not target:
             send_message(admin_user_id, f"⚠️ <b>Job skipped:</b> <code>{escape(str(name), quote=False)}</code>\nMissing target.")
             return
-        result: PingResult = run_ping(target, count, interval_sec)
-        text = format_report(name, result)
-        send_message(admin_user_id, text)
-        update_job(name, {"last_run_at": datetime.now(timezone.utc).isoformat()})
+        if result is None:
+            result = run_ping(target, count, interval_sec)
+        if _should_report(name, result, scheduled):
+            send_message(admin_user_id, format_report(name, result))
+        set_last_run(name, _ns_to_datetime(time.time_ns()).isoformat())
     except Exception as e:
         send_error(e, f"scheduler: _run_job name={job.get('name', '?')}")
 
 
 def _tick(send_message: SendMessageFunc, admin_user_id: int) -> None:
-    """Run every 10s: load jobs, run any whose next_run (last_run + schedule) <= now."""
+    """Run every 10s: load jobs, run any whose next_run (last_run + schedule) <= now, concurrently."""
     try:
-        now = datetime.now(timezone.utc)
-        jobs = load_jobs()
-        for job in jobs:
-            name = job.get("name", "?")
-            schedule_minutes = max(1, int(job.get("schedule_minutes", 5)))
-            last_run = _parse_last_run(job.get("last_run_at"))
-            if last_run is None:
-                next_run = now  # run immediately if never run
-            else:
-                next_run = last_run + timedelta(minutes=schedule_minutes)
-            if now >= next_run:
-                _run_job(job, send_message, admin_user_id)
+        now_ns = time.time_ns()
+        # Never-run jobs (next_run None) run immediately; plain int compares, no datetimes
+        due = [job for job, next_run in _scheduled_jobs() if next_run is None or now_ns >= next_run]
+        if len(due) == 1:
+            _run_job(due[0], send_message, admin_user_id, scheduled=True)
+        elif due:
+            # Ping all due jobs together, then report each
+            batch: list[dict] = []
+            specs: list[tuple[str, int, float]] = []
+            for job in due:
+                try:
+                    spec = _job_spec(job)
+                except (TypeError, ValueError):
+                    spec = None
+                if spec and spec[0]:
+                    batch.append(job)
+                    specs.append(spec)
+                else:
+                    _run_job(job, send_message, admin_user_id, scheduled=True)  # reports the skip or bad field
+            for job, result in zip(batch, run_pings(specs)):
+                _run_job(job, send_message, admin_user_id, result, scheduled=True)
     except Exception as e:
         send_error(e, "scheduler: _tick")
 
@@ -104,16 +198,9 @@ def get_next_run_times(_scheduler: object = None) -> dict[str, datetime]:
     """Return {job_name: next_run_time} from jobs (last_run_at + schedule_minutes). Timezone-aware."""
     try:
         out: dict[str, datetime] = {}
-        now = datetime.now(timezone.utc)
-        for job in load_jobs():
-            name = job.get("name", "?")
-            schedule_minutes = max(1, int(job.get("schedule_minutes", 5)))
-            last_run = _parse_last_run(job.get("last_run_at"))
-            if last_run is None:
-                next_run = now
-            else:
-                next_run = last_run + timedelta(minutes=schedule_minutes)
-            out[name] = next_run
+        now_ns = time.time_ns()
+        for job, next_run in _scheduled_jobs():
+            out[job.get("name", "?")] = _ns_to_datetime(next_run if next_run is not None else now_ns)
         return out
     except Exception as e:
         send_error(e, "scheduler: get_next_run_times")